@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Software License Agreement (GPL)
+#
+# \file      launcher_startup.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Compare the startup time of a program run via the python launcher against the previous bash heredoc wrapper."""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "..", "catkin_virtualenv", "cmake", "templates")
+
+# The install-space wrapper generated by catkin_install_python before the python launcher
+BASH_TEMPLATE = """#!/usr/bin/env bash
+
+if [ "${ARG_RENAME_PROCESS}" = "TRUE" ]; then
+\texec ${python} - "$@" <<- EOF
+\timport re
+\timport sys
+
+\tfrom setproctitle import setproctitle
+
+\tprogram_path = "${launcher_program}"
+\tsetproctitle(' '.join(["${program_basename}"] + sys.argv[1:]))
+\texec(open(program_path).read())
+\tEOF
+else
+\texec ${python} ${launcher_program} "$@"
+fi
+"""
+
+# A stand-in for a ROS node: a sizeable module body, and some imports
+PROGRAM = "import argparse\nimport json\nimport logging\n\n" + "\n".join(
+    "def handler_{0}(msg):\n    return {{'id': {0}, 'data': [m * 2 for m in msg if m % {1}]}}\n".format(i, i % 7 + 2)
+    for i in range(2000)
+)
+
+
+def render(template, path, variables):
+    with open(path, "w") as f:
+        f.write(re.sub(r"\$\{(\w+)\}", lambda match: variables[match.group(1)], template))
+    os.chmod(path, 0o755)
+
+
+def measure(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--python', default=sys.executable, help="Interpreter to launch the program with, e.g. a virtualenv's.")
+    parser.add_argument(
+        '--runs', type=int, default=50, help="Number of launches to time for each launcher.")
+    parser.add_argument(
+        '--rename-process', action='store_true', help="Rename the process, which requires setproctitle.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        program = os.path.join(work_dir, "scripts", "node")
+        os.makedirs(os.path.dirname(program))
+        with open(program, "w") as f:
+            f.write(PROGRAM)
+
+        variables = {
+            "python": args.python,
+            "launcher_header": "#!" + args.python,
+            "launcher_program": program,
+            "program_basename": "node",
+            "PROJECT_NAME": "benchmark",
+            "ARG_RENAME_PROCESS": "TRUE" if args.rename_process else "FALSE",
+        }
+        bash_launcher = os.path.join(work_dir, "node_bash")
+        render(BASH_TEMPLATE, bash_launcher, variables)
+        python_launcher = os.path.join(work_dir, "node_python")
+        with open(os.path.join(TEMPLATES_DIR, "program.install.in")) as f:
+            render(f.read(), python_launcher, variables)
+
+        # Precompile the program, as catkin_install_python does at install time
+        subprocess.run([args.python, "-m", "py_compile", program], check=True)
+
+        results = [("bash heredoc", measure([bash_launcher], args.runs))]
+        results.append(("python launcher", measure([python_launcher], args.runs)))
+
+    baseline = statistics.median(results[0][1])
+    for name, timings in results:
+        median = statistics.median(timings)
+        print("{:<16} median {:7.1f} ms  mean {:7.1f} ms  min {:7.1f} ms  ({:+.1f} ms per node)".format(
+            name, median, statistics.mean(timings), min(timings), median - baseline))
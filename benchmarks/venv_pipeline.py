@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# Software License Agreement (GPL)
+#
+# \file      venv_pipeline.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Time each step of building a virtualenv for synthetic catkin package graphs, offline against a local index."""
+
+import argparse
+import base64
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "catkin_virtualenv", "src"))
+
+from catkin_virtualenv.collect_requirements import ManifestIndex, collect_requirements  # noqa: E402
+from catkin_virtualenv.stage import stage  # noqa: E402
+from catkin_virtualenv.venv import Virtualenv  # noqa: E402
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+
+# Wheels needed to initialize a virtualenv, which pins them (see Virtualenv.initialize)
+BOOTSTRAP_REQUIREMENTS = ["pip==24.0", "pip-tools==7.4.1"]
+
+# The synthetic distributions making up the local index, each released as 1.0 and 1.1
+DISTRIBUTIONS = ["synth-{:02d}".format(i) for i in range(40)]
+VERSIONS = ["1.0", "1.1"]
+MODULE_FUNCTIONS = 200
+
+STEPS = ["collect_requirements", "initialize", "lock", "install", "check_static", "check_resolved", "relocate"]
+
+
+def build_wheel(directory, name, version, requires):
+    """Build a pure python wheel, byte for byte the same every time."""
+    module = name.replace("-", "_")
+    dist_info = "{}-{}.dist-info".format(module, version)
+    files = {
+        "{}/__init__.py".format(module): "".join(
+            "def function_{0}(value):\n    return value * {0} + {1!r}\n\n".format(i, version)
+            for i in range(MODULE_FUNCTIONS)
+        ),
+        dist_info + "/METADATA": "Metadata-Version: 2.1\nName: {}\nVersion: {}\n{}".format(
+            name, version, "".join("Requires-Dist: {}\n".format(requirement) for requirement in requires)
+        ),
+        dist_info + "/WHEEL": "Wheel-Version: 1.0\nGenerator: venv_pipeline\nRoot-Is-Purelib: true\n"
+        "Tag: py3-none-any\n",
+    }
+    record = dist_info + "/RECORD"
+    files[record] = "".join(
+        "{},sha256={},{}\n".format(
+            path,
+            base64.urlsafe_b64encode(hashlib.sha256(content.encode()).digest()).rstrip(b"=").decode(),
+            len(content.encode()),
+        )
+        for path, content in sorted(files.items())
+    ) + record + ",,\n"
+
+    with zipfile.ZipFile(os.path.join(directory, "{}-{}-py3-none-any.whl".format(module, version)), "w") as wheel:
+        for path, content in sorted(files.items()):
+            info = zipfile.ZipInfo(path, date_time=(1980, 1, 1, 0, 0, 0))
+            info.external_attr = 0o644 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            wheel.writestr(info, content)
+
+
+def build_index(directory, bootstrap_wheels):
+    """Populate a find-links index with the bootstrap wheels, and the synthetic distributions."""
+    os.makedirs(directory)
+    for wheel in glob.glob(os.path.join(bootstrap_wheels, "*.whl")):
+        shutil.copy(wheel, directory)
+
+    rng = random.Random(0)
+    for i, name in enumerate(DISTRIBUTIONS):
+        requires = ["{}>=1.0".format(dependency) for dependency in rng.sample(DISTRIBUTIONS[:i], min(i, 2))]
+        for version in VERSIONS:
+            build_wheel(directory, name, version, requires)
+
+
+def seed_manifests():
+    """Load the manifests of the test packages that export requirements, to derive synthetic packages from."""
+    manifests = []
+    for path in sorted(glob.glob(os.path.join(TESTS_DIR, "test_catkin_virtualenv*", "package.xml"))):
+        with open(path, "r") as f:
+            manifest = f.read()
+        if "<pip_requirements>" in manifest:
+            # Drop dependencies on the other test packages, synthetic packages get their own
+            manifests.append(re.sub(r"\s*<depend>test_catkin_virtualenv\w*</depend>", "", manifest))
+    return manifests
+
+
+def build_workspace(workspace, depth, width):
+    """
+    Lay out a workspace of depth levels of width packages, each depending on every package of the level below.
+
+    Every package exports pins of a few synthetic distributions, and a top-level package depends on the whole graph,
+    and locks its own requirements from a requirements.in. Returns the name of the top-level package, and the devel
+    space to find the workspace through.
+    """
+    rng = random.Random(depth * 1000 + width)
+    seeds = seed_manifests()
+    source_dir = os.path.join(workspace, "src")
+    levels = [["bench_l{}_p{}".format(level, i) for i in range(width)] for level in range(depth)] + [["bench_top"]]
+
+    for level, packages in enumerate(levels):
+        for i, package in enumerate(packages):
+            dependencies = levels[level - 1] if level > 0 else []
+            manifest = re.sub(r"<name>\w+</name>", "<name>{}</name>".format(package), seeds[(level + i) % len(seeds)])
+            manifest = manifest.replace(
+                "<buildtool_depend>catkin</buildtool_depend>",
+                "<buildtool_depend>catkin</buildtool_depend>" + "".join(
+                    "\n  <depend>{}</depend>".format(dependency) for dependency in dependencies
+                ),
+            )
+            manifest = re.sub(
+                r"<pip_requirements>[^<]*</pip_requirements>", "<pip_requirements>requirements.txt</pip_requirements>",
+                manifest
+            )
+            package_dir = os.path.join(source_dir, package)
+            os.makedirs(package_dir)
+            with open(os.path.join(package_dir, "package.xml"), "w") as f:
+                f.write(manifest)
+
+            distributions = sorted(rng.sample(DISTRIBUTIONS, 3))
+            if package == "bench_top":
+                with open(os.path.join(package_dir, "requirements.in"), "w") as f:
+                    f.writelines(name + "\n" for name in distributions)
+            else:
+                with open(os.path.join(package_dir, "requirements.txt"), "w") as f:
+                    f.writelines("{}=={}\n".format(name, VERSIONS[0]) for name in distributions)
+
+    # Make the source space discoverable the way catkin's devel space does
+    devel_dir = os.path.join(workspace, "devel")
+    os.makedirs(devel_dir)
+    with open(os.path.join(devel_dir, ".catkin"), "w") as f:
+        f.write(source_dir)
+    return "bench_top", devel_dir
+
+
+def timed(results, step, function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    results.setdefault(step, []).append(time.perf_counter() - start)
+    return value
+
+
+def run_pipeline(work_dir, python, package, extra_pip_args, results):
+    """Run each step of building a package's virtualenv in order, as catkin_generate_virtualenv does."""
+    venv_dir = os.path.join(work_dir, "venv")
+    venv = Virtualenv(venv_dir)
+
+    requirements = timed(
+        results, "collect_requirements", lambda: collect_requirements(package, index=ManifestIndex())
+    )
+    timed(results, "initialize", venv.initialize, python, use_system_packages=False, extra_pip_args=extra_pip_args)
+
+    package_requirements = requirements[-1]
+    if os.path.exists(package_requirements):
+        os.remove(package_requirements)
+    input_requirements = os.path.join(os.path.dirname(package_requirements), "requirements.in")
+    timed(results, "lock", venv.lock, package, input_requirements, no_overwrite=False, extra_pip_args=extra_pip_args)
+
+    timed(results, "install", venv.install, requirements, extra_pip_args)
+    timed(results, "check_static", venv.check, package_requirements, extra_pip_args, static=True)
+    timed(results, "check_resolved", venv.check, package_requirements, extra_pip_args, static=False)
+
+    staged_dir = os.path.join(work_dir, "staged")
+    stage(venv_dir, staged_dir)
+    timed(results, "relocate", Virtualenv(staged_dir).relocate, os.path.join(work_dir, "target"))
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    medians = {(entry["graph"], entry["step"]): entry["median"] for entry in baseline["results"]}
+    print("\nCompared to {}:".format(baseline["revision"]))
+    for entry in results["results"]:
+        previous = medians.get((entry["graph"], entry["step"]))
+        if previous:
+            print("{:<8} {:<22} {:>9.3f} s -> {:>9.3f} s  ({:+.1f}%)".format(
+                entry["graph"], entry["step"], previous, entry["median"], (entry["median"] / previous - 1) * 100))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--bootstrap-wheels', required=True,
+        help="Directory of wheels for {} and their dependencies, e.g. from `pip download -d`.".format(
+            " ".join(BOOTSTRAP_REQUIREMENTS)))
+    parser.add_argument(
+        '--python', default="python3", help="Interpreter to build virtualenvs with.")
+    parser.add_argument(
+        '--graphs', nargs='+', default=["1x1", "2x4", "4x8"], metavar='DEPTHxWIDTH',
+        help="Package graphs to build, as levels of dependencies by packages per level.")
+    parser.add_argument(
+        '--runs', type=int, default=3, help="Number of times to run the pipeline for each graph.")
+    parser.add_argument(
+        '--output', help="Where to write the results as JSON.")
+    parser.add_argument(
+        '--compare', help="Results of a previous run to compare against.")
+    args = parser.parse_args()
+
+    # Keep builds independent of each other, and of any caches on this machine
+    for variable in ("CATKIN_VIRTUALENV_CACHE_DIR", "CATKIN_VIRTUALENV_TRACE", "PIP_FIND_LINKS", "PIP_INDEX_URL"):
+        os.environ.pop(variable, None)
+
+    results = {"revision": git_revision(), "python": args.python, "results": []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        index_dir = os.path.join(work_dir, "index")
+        build_index(index_dir, args.bootstrap_wheels)
+        extra_pip_args = ["--no-index", "--find-links", index_dir]
+
+        for graph in args.graphs:
+            depth, width = (int(dimension) for dimension in graph.split("x"))
+            workspace = os.path.join(work_dir, graph)
+            package, devel_dir = build_workspace(workspace, depth, width)
+            os.environ["CMAKE_PREFIX_PATH"] = devel_dir
+
+            timings = {}
+            for run in range(args.runs):
+                run_dir = os.path.join(workspace, "run")
+                os.makedirs(run_dir)
+                run_pipeline(run_dir, args.python, package, extra_pip_args, timings)
+                shutil.rmtree(run_dir)
+
+            for step in STEPS:
+                results["results"].append({
+                    "graph": graph,
+                    "packages": depth * width + 1,
+                    "step": step,
+                    "runs": timings[step],
+                    "median": statistics.median(timings[step]),
+                })
+                print("{:<8} {:<22} median {:9.3f} s  min {:9.3f} s".format(
+                    graph, step, statistics.median(timings[step]), min(timings[step])))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
@@ -17,8 +17,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 function(catkin_generate_virtualenv)
-  set(oneValueArgs PYTHON_VERSION PYTHON_INTERPRETER USE_SYSTEM_PACKAGES ISOLATE_REQUIREMENTS INPUT_REQUIREMENTS CHECK_VENV)
-  set(multiValueArgs EXTRA_PIP_ARGS)
+  set(oneValueArgs PYTHON_VERSION PYTHON_INTERPRETER USE_SYSTEM_PACKAGES ISOLATE_REQUIREMENTS INPUT_REQUIREMENTS CHECK_VENV
+    MERGE_REQUIREMENTS SYNC_REQUIREMENTS BASE_PACKAGE PRECOMPILE_BYTECODE BYTECODE_INVALIDATION_MODE SLIM_VENV
+    ARCHIVE_VENV DEFER_INSTALL_VENV)
+  set(multiValueArgs EXTRA_PIP_ARGS BYTECODE_OPTIMIZE_LEVELS SLIM_EXCLUDE SLIM_INCLUDE)
   cmake_parse_arguments(ARG "${options}" "${oneValueArgs}" "${multiValueArgs}" ${ARGN} )
 
   ### Handle argument defaults and deprecations
@@ -42,6 +44,76 @@ function(catkin_generate_virtualenv)
     set(collect_args "--no-deps")
   endif()
 
+  if(DEFINED ARG_BASE_PACKAGE)
+    if(NOT DEFINED ${ARG_BASE_PACKAGE}_PREFIX)
+      message(FATAL_ERROR "BASE_PACKAGE ${ARG_BASE_PACKAGE} must be found via find_package(catkin COMPONENTS ...)")
+    endif()
+    message(STATUS "Stacking virtualenv on top of ${ARG_BASE_PACKAGE}'s virtualenv")
+    set(base_venv_devel_dir ${${ARG_BASE_PACKAGE}_PREFIX}/share/${ARG_BASE_PACKAGE}/venv)
+    if(${ARG_BASE_PACKAGE}_DEVEL_PREFIX)
+      # The base package is built in this workspace, so it will be installed alongside this one
+      set(base_venv_install_dir ${CMAKE_INSTALL_PREFIX}/share/${ARG_BASE_PACKAGE}/venv)
+    else()
+      set(base_venv_install_dir ${base_venv_devel_dir})
+    endif()
+    list(APPEND collect_args "--base-package" ${ARG_BASE_PACKAGE})
+    list(APPEND install_args "--base-venv" ${base_venv_devel_dir})
+    set(relocate_devel_args "--base-venv" ${base_venv_devel_dir})
+    set(relocate_install_args "--base-venv" ${base_venv_install_dir})
+  endif()
+
+  if(ARG_SYNC_REQUIREMENTS)
+    message(STATUS "Incrementally syncing requirements")
+    list(APPEND install_args "--sync")
+  elseif(ARG_MERGE_REQUIREMENTS)
+    message(STATUS "Installing all requirements in a single transaction")
+    list(APPEND install_args "--merge")
+  endif()
+  if(ARG_MERGE_REQUIREMENTS STREQUAL "STRICT" OR ARG_SYNC_REQUIREMENTS STREQUAL "STRICT")
+    list(APPEND install_args "--strict")
+  endif()
+
+  if(ARG_PRECOMPILE_BYTECODE)
+    message(STATUS "Precompiling virtualenv bytecode")
+    set(precompile_args "--precompile")
+    if(DEFINED ARG_BYTECODE_OPTIMIZE_LEVELS)
+      list(APPEND precompile_args "--optimize-levels" ${ARG_BYTECODE_OPTIMIZE_LEVELS})
+    endif()
+    set(precompile_devel_args ${precompile_args})
+    set(precompile_install_args ${precompile_args})
+    if(DEFINED ARG_BYTECODE_INVALIDATION_MODE)
+      list(APPEND precompile_devel_args "--invalidation-mode" ${ARG_BYTECODE_INVALIDATION_MODE})
+    endif()
+    if(ARG_ARCHIVE_VENV AND NOT ARG_BYTECODE_INVALIDATION_MODE MATCHES "-hash$")
+      # Archives don't keep file modification times, so timestamp-based bytecode would be stale once unpacked
+      if(DEFINED ARG_BYTECODE_INVALIDATION_MODE)
+        message(WARNING "ARCHIVE_VENV needs hash-based bytecode, using checked-hash for the installspace virtualenv")
+      endif()
+      list(APPEND precompile_install_args "--invalidation-mode" checked-hash)
+    elseif(DEFINED ARG_BYTECODE_INVALIDATION_MODE)
+      list(APPEND precompile_install_args "--invalidation-mode" ${ARG_BYTECODE_INVALIDATION_MODE})
+    endif()
+  endif()
+
+  if(ARG_SLIM_VENV)
+    message(STATUS "Slimming installspace virtualenv")
+    set(slim_install_args "--slim")
+    if(ARG_SLIM_VENV STREQUAL "NO_STRIP")
+      list(APPEND slim_install_args "--no-strip")
+    endif()
+    if(DEFINED ARG_SLIM_EXCLUDE)
+      list(APPEND slim_install_args "--slim-exclude" ${ARG_SLIM_EXCLUDE})
+    endif()
+    if(DEFINED ARG_SLIM_INCLUDE)
+      list(APPEND slim_install_args "--slim-include" ${ARG_SLIM_INCLUDE})
+    endif()
+  endif()
+
+  # Workspace-wide default, e.g. for developer builds that never install
+  if(NOT DEFINED ARG_DEFER_INSTALL_VENV)
+    set(ARG_DEFER_INSTALL_VENV ${CATKIN_VIRTUALENV_DEFER_INSTALL})
+  endif()
+
   if (NOT DEFINED ARG_EXTRA_PIP_ARGS)
     set(ARG_EXTRA_PIP_ARGS "-qq" "--retries 10" "--timeout 30")
   endif()
@@ -57,6 +129,11 @@ function(catkin_generate_virtualenv)
     return()
   endif()
 
+  # Workspace-wide content-addressed store to deduplicate site-packages across virtualenvs
+  if(NOT DEFINED CATKIN_VIRTUALENV_STORE_DIR AND DEFINED ENV{CATKIN_VIRTUALENV_STORE_DIR})
+    set(CATKIN_VIRTUALENV_STORE_DIR $ENV{CATKIN_VIRTUALENV_STORE_DIR})
+  endif()
+
   # Make sure CATKIN_* paths are initialized
   catkin_destinations()  # oh the places we'll go
 
@@ -66,36 +143,34 @@ function(catkin_generate_virtualenv)
   set(venv_devel_dir ${CATKIN_DEVEL_PREFIX}/${CATKIN_PACKAGE_SHARE_DESTINATION}/${venv_dir})
   set(venv_install_dir ${CMAKE_INSTALL_PREFIX}/${CATKIN_PACKAGE_SHARE_DESTINATION}/${venv_dir})
 
+  set(${PROJECT_NAME}_VENV_BUILD_DIR ${CMAKE_BINARY_DIR}/${venv_dir} PARENT_SCOPE)
   set(${PROJECT_NAME}_VENV_DEVEL_DIR ${venv_devel_dir} PARENT_SCOPE)
   set(${PROJECT_NAME}_VENV_INSTALL_DIR ${venv_install_dir} PARENT_SCOPE)
 
-  # Store just _this_ project's requirements file in ${package_requirements}
-  execute_process(
-    COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv collect_requirements
-      --package-name ${PROJECT_NAME} --no-deps
-    OUTPUT_VARIABLE package_requirements
-    OUTPUT_STRIP_TRAILING_WHITESPACE
-  )
-
-  # Collect all of this project's inherited requirements into ${requirements_list}
+  # Collect this project's own requirements file into ${package_requirements}, all of its inherited requirements into
+  # ${requirements_list} and, in isolated mode, catkin_virtualenv's own requirements into
+  # ${catkin_virtualenv_requirements}, in a single process. The file is per project, in case of a shared build directory
+  set(requirements_cmake ${PROJECT_BINARY_DIR}/${PROJECT_NAME}_virtualenv_requirements.cmake)
   execute_process(
     COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv collect_requirements
       --package-name ${PROJECT_NAME} ${collect_args}
-    OUTPUT_VARIABLE requirements_list
-    OUTPUT_STRIP_TRAILING_WHITESPACE
+      --cmake-output ${requirements_cmake}
+    RESULT_VARIABLE collect_result
   )
+  if(NOT collect_result EQUAL 0)
+    message(FATAL_ERROR "Failed to collect requirements for ${PROJECT_NAME}")
+  endif()
+  include(${requirements_cmake})
 
   # In isolated mode, we still need catkin_virtualenv's own requirements (pip-tools, etc)
   if(ARG_ISOLATE_REQUIREMENTS)
-    execute_process(
-      COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv collect_requirements --no-deps
-        --package-name catkin_virtualenv
-      OUTPUT_VARIABLE catkin_virtualenv_requirements
-      OUTPUT_STRIP_TRAILING_WHITESPACE
-    )
     set(requirements_list "${catkin_virtualenv_requirements};${requirements_list}")
   endif()
 
+  if((ARG_MERGE_REQUIREMENTS OR ARG_SYNC_REQUIREMENTS) AND NOT package_requirements STREQUAL "")
+    list(APPEND install_args --package-requirements ${package_requirements})
+  endif()
+
   # Trigger rebuild if any of the requirements files change
   foreach(requirements_file ${requirements_list})
     if(EXISTS ${requirements_file})
@@ -103,16 +178,19 @@ function(catkin_generate_virtualenv)
     endif()
   endforeach()
 
+  # Tag build traces (see CATKIN_VIRTUALENV_TRACE) with the package they belong to
+  set(venv_env ${CMAKE_COMMAND} -E env CATKIN_VIRTUALENV_TRACE_PACKAGE=${PROJECT_NAME} ${CATKIN_ENV})
+
   add_custom_command(COMMENT "Generate virtualenv in ${CMAKE_BINARY_DIR}/${venv_dir}"
     OUTPUT ${CMAKE_BINARY_DIR}/${venv_dir}/bin/python
-    COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_init ${venv_dir}
+    COMMAND ${venv_env} rosrun catkin_virtualenv venv_init ${venv_dir}
       --python ${ARG_PYTHON_INTERPRETER} ${venv_args} --extra-pip-args ${processed_pip_args}
   )
 
   if(DEFINED ARG_INPUT_REQUIREMENTS AND NOT package_requirements STREQUAL "")
     add_custom_command(COMMENT "Lock input requirements if they don't exist"
       OUTPUT ${package_requirements}
-      COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_lock ${CMAKE_BINARY_DIR}/${venv_dir}
+      COMMAND ${venv_env} rosrun catkin_virtualenv venv_lock ${CMAKE_BINARY_DIR}/${venv_dir}
         --package-name ${PROJECT_NAME} --input-requirements ${ARG_INPUT_REQUIREMENTS}
         --no-overwrite --extra-pip-args ${processed_pip_args}
       WORKING_DIRECTORY ${PROJECT_SOURCE_DIR}
@@ -124,24 +202,56 @@ function(catkin_generate_virtualenv)
 
   add_custom_command(COMMENT "Install requirements to ${CMAKE_BINARY_DIR}/${venv_dir}"
     OUTPUT ${CMAKE_BINARY_DIR}/${venv_dir}/bin/activate
-    COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_install ${venv_dir}
-      --requirements ${requirements_list} --extra-pip-args ${processed_pip_args}
+    COMMAND ${venv_env} rosrun catkin_virtualenv venv_install ${venv_dir}
+      --requirements ${requirements_list} --extra-pip-args ${processed_pip_args} ${install_args}
     DEPENDS
       ${CMAKE_BINARY_DIR}/${venv_dir}/bin/python
       ${package_requirements}
       ${requirements_list}
   )
 
+  # Commands to stage the installspace virtualenv, run at build time or, if deferred, at install time
+  set(stage_install ${venv_env} rosrun catkin_virtualenv venv_stage
+    ${CMAKE_BINARY_DIR}/${venv_dir} ${CMAKE_BINARY_DIR}/install/${venv_dir}
+    --target-dir ${venv_install_dir} ${relocate_install_args} ${precompile_install_args} ${slim_install_args}
+  )
+  set(stage_install_commands COMMAND ${stage_install})
+
+  if(ARG_ARCHIVE_VENV)
+    message(STATUS "Installing virtualenv as an archive")
+    set(venv_archive install/${venv_dir}.zip)
+    if(ARG_ARCHIVE_VENV STREQUAL "STORED")
+      set(archive_args "--stored")
+    endif()
+    set(archive_install ${venv_env} rosrun catkin_virtualenv venv_archive pack
+      ${CMAKE_BINARY_DIR}/install/${venv_dir} ${CMAKE_BINARY_DIR}/${venv_archive} ${archive_args}
+    )
+    list(APPEND stage_install_commands COMMAND ${archive_install})
+  endif()
+
+  if(ARG_DEFER_INSTALL_VENV)
+    message(STATUS "Deferring installspace virtualenv staging to install time")
+    set(stage_install_commands)
+  else()
+    set(venv_install_outputs install/${venv_dir} ${venv_archive})
+  endif()
+
+  if(CATKIN_VIRTUALENV_STORE_DIR)
+    message(STATUS "Deduplicating virtualenv files into ${CATKIN_VIRTUALENV_STORE_DIR}")
+    set(dedupe_command
+      COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_dedupe
+        ${CMAKE_BINARY_DIR}/${venv_dir} ${venv_devel_dir} ${venv_install_outputs} --store ${CATKIN_VIRTUALENV_STORE_DIR}
+    )
+  endif()
+
   add_custom_command(COMMENT "Prepare relocated virtualenvs for develspace and installspace"
-    OUTPUT ${venv_devel_dir} install/${venv_dir}
+    OUTPUT ${venv_devel_dir} ${venv_install_outputs}
     # CMake copy_directory doesn't preserve symlinks https://gitlab.kitware.com/cmake/cmake/issues/14609
-    # COMMAND ${CMAKE_COMMAND} -E copy_directory ${venv_dir} ${venv_devel_dir}
-    # COMMAND ${CMAKE_COMMAND} -E copy_directory ${venv_dir} install/${venv_dir}
-    COMMAND mkdir -p ${venv_devel_dir} && cp -r ${venv_dir}/* ${venv_devel_dir}
-    COMMAND mkdir -p install/${venv_dir} && cp -r ${venv_dir}/* install/${venv_dir}
-
-    COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_relocate ${venv_devel_dir} --target-dir ${venv_devel_dir}
-    COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_relocate install/${venv_dir} --target-dir ${venv_install_dir}
+    # Staging reflinks or hardlinks files from the build virtualenv rather than copying them
+    COMMAND ${venv_env} rosrun catkin_virtualenv venv_stage ${venv_dir} ${venv_devel_dir}
+      --target-dir ${venv_devel_dir} ${relocate_devel_args} ${precompile_devel_args}
+    ${stage_install_commands}
+    ${dedupe_command}
     DEPENDS ${CMAKE_BINARY_DIR}/${venv_dir}/bin/activate
   )
 
@@ -149,12 +259,12 @@ function(catkin_generate_virtualenv)
     COMMENT "Per-package virtualenv target"
     DEPENDS
       ${venv_devel_dir}
-      install/${venv_dir}
+      ${venv_install_outputs}
   )
 
   add_custom_target(${PROJECT_NAME}_venv_lock
     COMMENT "Manually invoked target to generate the lock file on demand"
-    COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_lock ${CMAKE_BINARY_DIR}/${venv_dir}
+    COMMAND ${venv_env} rosrun catkin_virtualenv venv_lock ${CMAKE_BINARY_DIR}/${venv_dir}
       --package-name ${PROJECT_NAME} --input-requirements ${ARG_INPUT_REQUIREMENTS}
       --extra-pip-args ${processed_pip_args}
     WORKING_DIRECTORY ${PROJECT_SOURCE_DIR}
@@ -166,15 +276,41 @@ function(catkin_generate_virtualenv)
   if(CATKIN_ENABLE_TESTING AND NOT package_requirements STREQUAL "" AND (NOT DEFINED ARG_CHECK_VENV OR ARG_CHECK_VENV))
     file(MAKE_DIRECTORY ${CATKIN_TEST_RESULTS_DIR}/${PROJECT_NAME})
     catkin_run_tests_target("venv_check" "${PROJECT_NAME}-requirements" "venv_check-${PROJECT_NAME}-requirements.xml"
-      COMMAND "${CATKIN_ENV} rosrun catkin_virtualenv venv_check ${venv_dir} --requirements ${package_requirements} --extra-pip-args \"${processed_pip_args}\" --xunit-output ${CATKIN_TEST_RESULTS_DIR}/${PROJECT_NAME}/venv_check-${PROJECT_NAME}-requirements.xml"
+      COMMAND "${CMAKE_COMMAND} -E env CATKIN_VIRTUALENV_TRACE_PACKAGE=${PROJECT_NAME} ${CATKIN_ENV} rosrun catkin_virtualenv venv_check ${venv_dir} --requirements ${package_requirements} --extra-pip-args \"${processed_pip_args}\" --xunit-output ${CATKIN_TEST_RESULTS_DIR}/${PROJECT_NAME}/venv_check-${PROJECT_NAME}-requirements.xml"
       DEPENDENCIES ${PROJECT_NAME}_generate_virtualenv
       WORKING_DIRECTORY ${CMAKE_BINARY_DIR}
     )
   endif()
 
-  install(DIRECTORY ${CMAKE_BINARY_DIR}/install/${venv_dir}
-    DESTINATION ${CATKIN_PACKAGE_SHARE_DESTINATION}
-    USE_SOURCE_PERMISSIONS)
+  if(ARG_DEFER_INSTALL_VENV)
+    # Stage the installspace virtualenv from the build space virtualenv just before installing it, as the build would
+    foreach(command stage_install archive_install)
+      if(DEFINED ${command})
+        install(CODE "execute_process(COMMAND ${${command}} RESULT_VARIABLE result)
+          if(NOT result EQUAL 0)
+            message(FATAL_ERROR \"Failed to prepare virtualenv for installspace\")
+          endif()"
+        )
+      endif()
+    endforeach()
+  endif()
+
+  if(ARG_ARCHIVE_VENV)
+    # Deployment unpacks (or mounts) the archive at ${venv_install_dir}, which the virtualenv is relocated to
+    install(FILES ${CMAKE_BINARY_DIR}/${venv_archive}
+      DESTINATION ${CATKIN_PACKAGE_SHARE_DESTINATION})
+  else()
+    install(DIRECTORY ${CMAKE_BINARY_DIR}/install/${venv_dir}
+      DESTINATION ${CATKIN_PACKAGE_SHARE_DESTINATION}
+      USE_SOURCE_PERMISSIONS)
+  endif()
+
+  if(CATKIN_VIRTUALENV_STORE_DIR AND NOT ARG_ARCHIVE_VENV)
+    install(CODE "execute_process(
+      COMMAND ${CATKIN_ENV} rosrun catkin_virtualenv venv_dedupe
+        \$ENV{DESTDIR}${venv_install_dir} --store ${CATKIN_VIRTUALENV_STORE_DIR}
+    )")
+  endif()
 
   # (pbovbel): NOSETESTS originally set by catkin here:
   # <https://github.com/ros/catkin/blob/kinetic-devel/cmake/test/nosetests.cmake#L86>
@@ -16,6 +16,17 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
+# Set launcher_header to the first lines of a python launcher running the given interpreter
+macro(_catkin_virtualenv_launcher_header python)
+  string(LENGTH "#!${python}" shebang_length)
+  if(shebang_length LESS 128)
+    set(launcher_header "#!${python}")
+  else()
+    # Older kernels truncate long shebangs, so run long interpreter paths via a shell trampoline
+    set(launcher_header "#!/bin/sh\n'''exec' \"${python}\" \"$0\" \"$@\"\n' '''")
+  endif()
+endmacro()
+
 function(catkin_install_python)
   # See https://github.com/ros/catkin/blob/kinetic-devel/cmake/catkin_install_python.cmake for overriden function
   set(options OPTIONAL)
@@ -66,17 +77,21 @@ will not work as expected.")
 
       set(program_install_location ${CATKIN_PACKAGE_SHARE_DESTINATION}/catkin_virtualenv_scripts)
 
-      # For devel-space support, we generate a bash script that invokes the source script via the virtualenv's
+      # For devel-space support, we generate a python launcher that runs the source script with the virtualenv's
       # python interpreter.
       set(devel_program ${CATKIN_DEVEL_PREFIX}/${ARG_DESTINATION}/${program_basename})
+      set(launcher_program ${program_path})
+      _catkin_virtualenv_launcher_header(${${PROJECT_NAME}_VENV_DEVEL_DIR}/bin/python)
       configure_file(${catkin_virtualenv_CMAKE_DIR}/templates/program.devel.in ${devel_program})
       execute_process(
         COMMAND ${CATKIN_ENV} chmod +x ${devel_program}
       )
 
-      # For install-space support, we install the source script, and then generate a bash script to invoke it using
+      # For install-space support, we install the source script, and then generate a python launcher to run it using
       # the virtualenv's python interpreter.
       set(install_program ${CMAKE_BINARY_DIR}/${program_basename})
+      set(launcher_program ${CMAKE_INSTALL_PREFIX}/${program_install_location}/${program_basename})
+      _catkin_virtualenv_launcher_header(${${PROJECT_NAME}_VENV_INSTALL_DIR}/bin/python)
       configure_file(${catkin_virtualenv_CMAKE_DIR}/templates/program.install.in ${install_program})
       execute_process(
         COMMAND ${CATKIN_ENV} chmod +x ${install_program}
@@ -87,6 +102,17 @@ will not work as expected.")
         DESTINATION ${program_install_location}
       )
 
+      # Precompile the installed script, so the launcher doesn't compile it on every start from a read-only install
+      install(CODE "execute_process(
+        COMMAND ${${PROJECT_NAME}_VENV_BUILD_DIR}/bin/python -c
+          \"import py_compile, sys; py_compile.compile(sys.argv[1], dfile=sys.argv[2], doraise=True)\"
+          \$ENV{DESTDIR}${launcher_program} ${launcher_program}
+        RESULT_VARIABLE result
+      )
+      if(NOT result EQUAL 0)
+        message(FATAL_ERROR \"Failed to precompile ${launcher_program}\")
+      endif()")
+
       install(
         PROGRAMS ${install_program}
         DESTINATION ${ARG_DESTINATION}
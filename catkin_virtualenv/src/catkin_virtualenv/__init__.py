@@ -20,6 +20,8 @@
 import logging
 import subprocess
 
+from . import trace
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,4 +38,16 @@ def run_command(cmd, *args, **kwargs):
     if kwargs.pop("capture_output", False):
         kwargs["stdout"] = subprocess.PIPE
         kwargs["stderr"] = subprocess.PIPE
+    tracer = trace.get_tracer()
+    if tracer is not None:
+        return tracer.run(cmd, *args, **kwargs)
     return subprocess.run(cmd, *args, **kwargs)
+
+
+def popen_command(cmd, *args, **kwargs):
+    """Start a command like subprocess.Popen, for use as a context manager, e.g. to stream its output."""
+    logger.info(" ".join(cmd))
+    tracer = trace.get_tracer()
+    if tracer is not None:
+        return tracer.popen(cmd, *args, **kwargs)
+    return subprocess.Popen(cmd, *args, **kwargs)
@@ -0,0 +1,241 @@
+# Software License Agreement (GPL)
+#
+# \file      archive.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import logging
+import lzma
+import mmap
+import os
+import shutil
+import stat
+import struct
+import tempfile
+import zipfile
+
+from contextlib import contextmanager
+
+# Every member gets the same timestamp, so an archive only depends on the virtualenv's content
+_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Zip keeps the unix mode in the top 16 bits of a member's external attributes
+_MODE_SHIFT = 16
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+
+_DELTA_MAGIC = b"catkin_virtualenv delta 1\n"
+
+logger = logging.getLogger(__name__)
+
+
+def pack(venv_dir, output, compression=zipfile.ZIP_DEFLATED):
+    # type: (str, str, int) -> int
+    """
+    Pack a virtualenv into a single zip archive, returning the number of members.
+
+    Archives are reproducible: members are sorted by path and carry no timestamps, so packing the same virtualenv twice
+    gives the same bytes, and unchanged files are stored identically across versions of a virtualenv. File modes and
+    symlinks are kept. With ZIP_STORED, every file can be read (or mmapped) in place via the archive's index.
+    """
+    members = []
+    for root, dirs, files in os.walk(venv_dir):
+        dirs.sort()
+        for name in dirs + files:
+            members.append(os.path.join(root, name))
+    members.sort(key=lambda path: os.path.relpath(path, venv_dir))
+
+    with _atomic_write(output) as f:
+        with zipfile.ZipFile(f, "w") as archive:
+            for path in members:
+                _write_member(archive, path, os.path.relpath(path, venv_dir), compression)
+    logger.info("Packed {} into {} ({} members)".format(venv_dir, output, len(members)))
+    return len(members)
+
+
+def unpack(archive_path, destination):
+    # type: (str, str) -> None
+    """Unpack an archive made by pack into a new directory, restoring file modes and symlinks."""
+    if os.path.lexists(destination):
+        raise RuntimeError("Cannot unpack {}, {} already exists".format(archive_path, destination))
+    parent = os.path.dirname(os.path.abspath(destination))
+    temp = tempfile.mkdtemp(dir=parent, prefix=".unpack-")
+    try:
+        directories = []
+        with zipfile.ZipFile(archive_path, "r") as archive:
+            for info in archive.infolist():
+                path = os.path.join(temp, *info.filename.rstrip("/").split("/"))
+                if not os.path.realpath(path).startswith(os.path.realpath(temp) + os.sep):
+                    raise RuntimeError("Refusing to unpack {} outside of {}".format(info.filename, destination))
+                mode = info.external_attr >> _MODE_SHIFT
+                if stat.S_ISLNK(mode):
+                    os.symlink(archive.read(info).decode(), path)
+                elif info.is_dir():
+                    os.makedirs(path, exist_ok=True)
+                    directories.append((path, mode))
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with archive.open(info) as source, open(path, "wb") as f:
+                        shutil.copyfileobj(source, f)
+                    os.chmod(path, stat.S_IMODE(mode))
+        # Restore directory modes last, in case they're read-only
+        for path, mode in reversed(directories):
+            os.chmod(path, stat.S_IMODE(mode))
+        os.chmod(temp, 0o755)
+        os.rename(temp, destination)
+    except BaseException:
+        shutil.rmtree(temp, ignore_errors=True)
+        raise
+
+
+def create_delta(old, new, output):
+    # type: (str, str, str) -> Tuple[int, int]
+    """
+    Create a binary delta between two archives made by pack, returning (bytes copied from old, bytes of new data).
+
+    The new archive is split into members and central directory records, and any of those already found byte for byte
+    in the old archive are copied from it when the delta is applied. Only what's left is shipped, compressed, so a delta
+    is about as large as the distributions that changed between the two virtualenvs.
+    """
+    with _mapped(old) as old_data, _mapped(new) as new_data:
+        return _create_delta(old, new, output, old_data, new_data)
+
+
+def _create_delta(old, new, output, old_data, new_data):
+    old_chunks = {}
+    for start, end in _chunks(old, len(old_data)):
+        old_chunks.setdefault(hashlib.sha256(old_data[start:end]).digest(), start)
+
+    operations = []
+    inserted = []
+    copied = 0
+    for start, end in _chunks(new, len(new_data)):
+        chunk = new_data[start:end]
+        old_start = old_chunks.get(hashlib.sha256(chunk).digest())
+        if old_start is not None:
+            copied += len(chunk)
+            if operations and operations[-1][0] == "copy" and sum(operations[-1][1:]) == old_start:
+                operations[-1][2] += len(chunk)
+            else:
+                operations.append(["copy", old_start, len(chunk)])
+        else:
+            inserted.append(chunk)
+            if operations and operations[-1][0] == "insert":
+                operations[-1][1] += len(chunk)
+            else:
+                operations.append(["insert", len(chunk)])
+
+    header = {
+        "old_sha256": hashlib.sha256(old_data).hexdigest(),
+        "new_sha256": hashlib.sha256(new_data).hexdigest(),
+        "operations": operations,
+    }
+    with _atomic_write(output) as f:
+        with lzma.open(f, "wb", preset=9) as delta:
+            delta.write(_DELTA_MAGIC)
+            delta.write(json.dumps(header, separators=(",", ":")).encode() + b"\n")
+            for chunk in inserted:
+                delta.write(chunk)
+    inserted_size = sum(len(chunk) for chunk in inserted)
+    logger.info("Created delta {} from {} to {}: {} bytes copied, {} bytes new".format(
+        output, old, new, copied, inserted_size))
+    return copied, inserted_size
+
+
+def apply_delta(old, delta_path, output):
+    # type: (str, str, str) -> None
+    """Rebuild a new archive from an old one and a delta made by create_delta, verifying both along the way."""
+    with _mapped(old) as old_data, lzma.open(delta_path, "rb") as delta:
+        if delta.readline() != _DELTA_MAGIC:
+            raise RuntimeError("{} is not a virtualenv archive delta".format(delta_path))
+        header = json.loads(delta.readline().decode())
+        if hashlib.sha256(old_data).hexdigest() != header["old_sha256"]:
+            raise RuntimeError("Delta {} does not apply to {}".format(delta_path, old))
+
+        new_hash = hashlib.sha256()
+        with _atomic_write(output) as f:
+            for operation in header["operations"]:
+                if operation[0] == "copy":
+                    chunk = old_data[operation[1]:operation[1] + operation[2]]
+                else:
+                    chunk = delta.read(operation[1])
+                new_hash.update(chunk)
+                f.write(chunk)
+            if new_hash.hexdigest() != header["new_sha256"]:
+                raise RuntimeError("Applying delta {} to {} did not reproduce the new archive".format(
+                    delta_path, old))
+
+
+def _write_member(archive, path, name, compression):
+    st = os.lstat(path)
+    if stat.S_ISDIR(st.st_mode):
+        info = zipfile.ZipInfo(name + "/", date_time=_DATE_TIME)
+        info.external_attr = (st.st_mode << _MODE_SHIFT) | 0x10  # MS-DOS directory flag
+        archive.writestr(info, b"")
+        return
+    info = zipfile.ZipInfo(name, date_time=_DATE_TIME)
+    info.external_attr = st.st_mode << _MODE_SHIFT
+    if stat.S_ISLNK(st.st_mode):
+        archive.writestr(info, os.readlink(path).encode())
+    else:
+        info.compress_type = compression
+        with open(path, "rb") as f:
+            archive.writestr(info, f.read())
+
+
+def _chunks(path, size):
+    """Split an archive into its members, and the central directory into its records, as (start, end) offsets."""
+    with zipfile.ZipFile(path, "r") as archive, open(path, "rb") as f:
+        infos = sorted(archive.infolist(), key=lambda info: info.header_offset)
+        offsets = [info.header_offset for info in infos]
+        if infos:
+            last = infos[-1]
+            f.seek(last.header_offset)
+            fields = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            central_directory = last.header_offset + _LOCAL_HEADER.size + fields[-2] + fields[-1] + last.compress_size
+        else:
+            central_directory = 0
+        f.seek(central_directory)
+        trailer = f.read()
+
+    start = central_directory
+    while True:
+        offset = trailer.find(_CENTRAL_HEADER_SIGNATURE, start - central_directory + 1)
+        if offset < 0:
+            break
+        offsets.append(central_directory + offset)
+        start = central_directory + offset
+    boundaries = sorted(set(offsets + [central_directory])) + [size]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+@contextmanager
+def _mapped(path):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield data
+
+
+@contextmanager
+def _atomic_write(path):
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
@@ -0,0 +1,76 @@
+# Software License Agreement (GPL)
+#
+# \file      cache.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+
+CACHE_DIR_ENV = "CATKIN_VIRTUALENV_CACHE_DIR"
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir(*subdirs):
+    # type: (str) -> Optional[str]
+    """
+    Return (and create) a directory inside the shared catkin_virtualenv cache.
+
+    Caching is opt-in: if CATKIN_VIRTUALENV_CACHE_DIR is not set, None is returned and callers should fall back to
+    building everything from scratch.
+    """
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        return None
+    path = os.path.join(os.path.abspath(os.path.expanduser(root)), *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def hash_key(*parts):
+    # type: (Any) -> str
+    """Compute a stable content hash for a set of JSON-serializable cache key components."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False, blocking=True):
+    # type: (str, bool, bool) -> Iterator[bool]
+    """
+    Hold an advisory lock on path for the duration of the context.
+
+    Yields whether the lock was acquired, which can only be False for a non-blocking attempt.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -20,19 +20,30 @@
 from __future__ import print_function
 
 import distro
+import functools
+import json
 import logging
 import os
+import tempfile
 
 from queue import Queue
 from catkin.find_in_workspaces import find_in_workspaces
+from catkin.workspace import get_workspaces
 from catkin_pkg.package import parse_package
 
+from .cache import file_lock, get_cache_dir, hash_key
 
 CATKIN_VIRTUALENV_TAGNAME = "pip_requirements"
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache()
+def get_distro_codename():
+    # type: () -> str
+    return distro.codename().lower()
+
+
 def get_distro_requirements_path(base_requirements_path):
     # type: (str) -> str
     """
@@ -40,13 +51,11 @@ def get_distro_requirements_path(base_requirements_path):
     distro-specific requirements file if it exists (e.g., 'requirements-jammy.txt' on Ubuntu Jammy).
     Falls back to the original path if no distro-specific file exists.
     """
-    codename = distro.codename().lower()
+    codename = get_distro_codename()
     if not codename:
         return base_requirements_path
 
-    # Split the path to insert the distro codename
-    base, ext = os.path.splitext(base_requirements_path)
-    distro_requirements_path = f"{base}-{codename}{ext}"
+    distro_requirements_path = get_variant_requirements_path(base_requirements_path, codename)
 
     if os.path.exists(distro_requirements_path):
         logger.info(f"Using distro-specific requirements file: {distro_requirements_path}")
@@ -55,6 +64,23 @@ def get_distro_requirements_path(base_requirements_path):
     return base_requirements_path
 
 
+def get_variant_requirements_path(base_requirements_path, codename):
+    # type: (str, str) -> str
+    """Insert a distro codename into a requirements path, e.g. 'requirements.txt' to 'requirements-noble.txt'."""
+    base, ext = os.path.splitext(base_requirements_path)
+    return f"{base}-{codename}{ext}"
+
+
+def get_base_requirements_path(requirements_path):
+    # type: (str) -> str
+    """Undo get_distro_requirements_path, returning the base path of a requirements file for this distro."""
+    codename = get_distro_codename()
+    base, ext = os.path.splitext(requirements_path)
+    if codename and base.endswith(f"-{codename}"):
+        return base[: -len(codename) - 1] + ext
+    return requirements_path
+
+
 def parse_exported_requirements(package, package_dir):
     # type: (catkin_pkg.package.Package) -> List[str]
     requirements_list = []
@@ -66,25 +92,122 @@ def parse_exported_requirements(package, package_dir):
     return requirements_list
 
 
-def process_package(package_name, soft_fail=True):
-    # type: (str) -> List[str], List[str]
-    try:
-        package_path = find_in_workspaces(project=package_name, path="package.xml", first_match_only=True,)[0]
-    except IndexError:
+class ManifestIndex:
+    def __init__(self, path=None):
+        """
+        Index catkin packages by name, for collecting requirements without crawling workspaces for every package.
+
+        Each entry holds where a package's manifest lives, its exported requirements (with distro-specific files
+        resolved) and its dependencies. Entries are revalidated against the modification times of the manifest and the
+        directories holding its requirements, and the whole index against the workspaces it was built from. Names that
+        aren't catkin packages (e.g. rosdep keys) are indexed as well. If a path is given, the index persists there
+        between processes, delete it to force a full crawl.
+        """
+        workspaces = get_workspaces()
+        self.path = path
+        self._signature = [[workspace, _mtime(os.path.join(workspace, ".catkin"))] for workspace in workspaces]
+        self._signature.append(get_distro_codename())
+        self._entries = {}
+        self._updated = {}
+        if path is not None:
+            self._entries = self._load()
+
+    @staticmethod
+    def default_path():
+        # type: () -> Optional[str]
+        """Locate the index for the current workspaces in the shared cache, if enabled."""
+        index_dir = get_cache_dir("index")
+        if index_dir is None:
+            return None
+        return os.path.join(index_dir, hash_key(get_workspaces()) + ".json")
+
+    def lookup(self, package_name, refresh=False):
+        # type: (str, bool) -> Dict
+        entry = self._entries.get(package_name)
+        if refresh or entry is None or any(_mtime(path) != mtime for path, mtime in entry["mtimes"].items()):
+            entry = self._index_package(package_name)
+            self._entries[package_name] = entry
+            self._updated[package_name] = entry
+        return entry
+
+    def save(self):
+        """Persist new entries, merging them with any added to the index by other processes in the meantime."""
+        if self.path is None or not self._updated:
+            return
+        with file_lock(self.path + ".lock"):
+            entries = self._load()
+            entries.update(self._updated)
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(fd, "w") as f:
+                json.dump({"signature": self._signature, "packages": entries}, f)
+            os.replace(temp, self.path)
+        self._updated = {}
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        if index.get("signature") != self._signature:
+            logger.info("Workspaces changed, discarding manifest index {}".format(self.path))
+            return {}
+        return index["packages"]
+
+    def add(self, package_path, package=None):
+        # type: (str, Optional[catkin_pkg.package.Package]) -> None
+        """Index a package from its manifest, e.g. one that isn't in a built workspace yet."""
+        if package is None:
+            package = parse_package(package_path)
+        entry = self._index_manifest(package_path, package)
+        self._entries[package.name] = entry
+        self._updated[package.name] = entry
+
+    def _index_package(self, package_name):
+        try:
+            package_path = find_in_workspaces(project=package_name, path="package.xml", first_match_only=True,)[0]
+        except IndexError:
+            # This is not a catkin package
+            return {"manifest": None, "mtimes": {}, "requirements": [], "dependencies": []}
+        return self._index_manifest(package_path, parse_package(package_path))
+
+    def _index_manifest(self, package_path, package):
+        package_dir = os.path.dirname(package_path)
+        requirements = parse_exported_requirements(package, package_dir)
+        mtimes = {package_path: _mtime(package_path)}
+        for requirements_path in requirements:
+            # Adding or removing a distro-specific requirements file changes the directory's mtime
+            requirements_dir = os.path.dirname(requirements_path)
+            mtimes[requirements_dir] = _mtime(requirements_dir)
+        return {
+            "manifest": package_path,
+            "mtimes": mtimes,
+            "requirements": requirements,
+            "dependencies": [dependency.name for dependency in package.build_depends + package.test_depends],
+        }
+
+
+def process_package(package_name, soft_fail=True, index=None):
+    # type: (str, bool, Optional[ManifestIndex]) -> Tuple[List[str], List[str]]
+    if index is None:
+        index = ManifestIndex()
+    entry = index.lookup(package_name)
+    if entry["manifest"] is None and not soft_fail:
+        # Packages that must exist might have been added since they were indexed
+        entry = index.lookup(package_name, refresh=True)
+    if entry["manifest"] is None:
         if not soft_fail:
             raise RuntimeError("Unable to process package {}".format(package_name))
-        else:
-            # This is not a catkin dependency
-            return [], []
-    else:
-        package = parse_package(package_path)
-        dependencies = package.build_depends + package.test_depends
-        return parse_exported_requirements(package, os.path.dirname(package_path)), dependencies
+        # This is not a catkin dependency
+        return [], []
+    return entry["requirements"], entry["dependencies"]
 
 
-def collect_requirements(package_name, no_deps=False):
-    # type: (str, bool) -> List[str]
+def collect_requirements(package_name, no_deps=False, base_package=None, index=None):
+    # type: (str, bool, Optional[str], Optional[ManifestIndex]) -> List[str]
     """ Collect requirements inherited by a package. """
+    if index is None:
+        index = ManifestIndex()
     package_queue = Queue()
     package_queue.put(package_name)
     processed_packages = set()
@@ -96,7 +219,7 @@ def collect_requirements(package_name, no_deps=False):
         if queued_package not in processed_packages:
             processed_packages.add(queued_package)
             requirements, dependencies = process_package(
-                package_name=queued_package, soft_fail=(queued_package != package_name)
+                package_name=queued_package, soft_fail=(queued_package != package_name), index=index
             )
             requirements_list = requirements + requirements_list
 
@@ -104,6 +227,18 @@ def collect_requirements(package_name, no_deps=False):
                 # Add dependencies in reverse order so that with prepend logic,
                 # they end up in declaration order (first declared = installed first)
                 for dependency in reversed(dependencies):
-                    package_queue.put(dependency.name)
+                    package_queue.put(dependency)
+
+    if base_package is not None:
+        # Anything the base package's virtualenv already provides doesn't need to be installed again
+        base_requirements = set(collect_requirements(base_package, index=index))
+        requirements_list = [r for r in requirements_list if r not in base_requirements]
 
     return requirements_list
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,135 @@
+# Software License Agreement (GPL)
+#
+# \file      distributions.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import glob
+import logging
+import os
+
+from email.parser import HeaderParser
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+logger = logging.getLogger(__name__)
+
+
+class Distribution:
+    def __init__(self, metadata_dir):
+        """Read the metadata of an installed distribution from its .dist-info or .egg-info directory."""
+        self.metadata_dir = metadata_dir
+
+        if metadata_dir.endswith(".dist-info"):
+            metadata_file = os.path.join(metadata_dir, "METADATA")
+        else:
+            metadata_file = os.path.join(metadata_dir, "PKG-INFO")
+
+        with open(metadata_file, "r", encoding="utf-8", errors="replace") as f:
+            metadata = HeaderParser().parse(f)
+
+        self.name = canonicalize_name(metadata["Name"])
+        self.version = metadata["Version"]
+        self.extras = set(metadata.get_all("Provides-Extra") or [])
+        self.requires = []
+        for spec in metadata.get_all("Requires-Dist") or self._read_egg_requires():
+            try:
+                self.requires.append(Requirement(spec))
+            except InvalidRequirement:
+                logger.info("Ignoring unparseable dependency {} of {}".format(spec, self.name))
+
+    def files(self):
+        """List the files recorded as belonging to this distribution, relative to its site-packages directory."""
+        record = os.path.join(self.metadata_dir, "RECORD")
+        if not os.path.exists(record):
+            return []
+        with open(record, "r", encoding="utf-8", errors="replace") as f:
+            return [line.rsplit(",", 2)[0] for line in f.read().splitlines() if line]
+
+    def _read_egg_requires(self):
+        requires_txt = os.path.join(self.metadata_dir, "requires.txt")
+        if not os.path.exists(requires_txt):
+            return []
+        requires = []
+        conditions = []
+        with open(requires_txt, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("[") and line.endswith("]"):
+                    # Requirements after a section header are conditional on an extra, a marker, or both
+                    extra, _, marker = line[1:-1].partition(":")
+                    conditions = ["({})".format(marker)] if marker else []
+                    if extra:
+                        conditions.append('extra == "{}"'.format(extra))
+                elif line:
+                    requires.append(line + "; " + " and ".join(conditions) if conditions else line)
+        return requires
+
+
+def find_site_packages(venv_dir):
+    # type: (str) -> List[str]
+    """Find the site-packages directories of a virtualenv."""
+    return sorted(glob.glob(os.path.join(venv_dir, "lib", "python*", "site-packages")))
+
+
+def installed_distributions(site_packages):
+    # type: (List[str]) -> Dict[str, Distribution]
+    """Index the distributions installed in a set of site-packages directories by canonical name."""
+    distributions = {}
+    for directory in site_packages:
+        for metadata_dir in sorted(os.listdir(directory)):
+            if not metadata_dir.endswith((".dist-info", ".egg-info")):
+                continue
+            path = os.path.join(directory, metadata_dir)
+            if not os.path.isdir(path):
+                continue
+            try:
+                distribution = Distribution(path)
+            except (IOError, TypeError):
+                logger.info("Ignoring distribution with unreadable metadata in {}".format(path))
+                continue
+            distributions.setdefault(distribution.name, distribution)
+    return distributions
+
+
+def dependency_closure(names, distributions, extras=None, environment=None):
+    # type: (Iterable[str], Dict[str, Distribution], Optional[Dict[str, Set[str]]], Optional[Dict]) -> Set[str]
+    """
+    Find every installed distribution that the named ones depend on, with the extras requested for them.
+
+    extras maps canonical names to the extras requested for them, and environment holds the marker variables of the
+    interpreter that will run the distributions (this interpreter's, by default). Extras requested by dependencies are
+    followed through as well.
+    """
+    extras = extras or {}
+    closure = set()
+    queue = []
+    for name in names:
+        name = canonicalize_name(name)
+        queue += [(name, extra) for extra in [""] + sorted(extras.get(name, ()))]
+    visited = set()
+    while queue:
+        name, extra = queue.pop()
+        if (name, extra) in visited or name not in distributions:
+            continue
+        visited.add((name, extra))
+        closure.add(name)
+        for requirement in distributions[name].requires:
+            if requirement.marker is not None and not requirement.marker.evaluate(dict(environment or {}, extra=extra)):
+                continue
+            dependency_name = canonicalize_name(requirement.name)
+            queue += [(dependency_name, dependency_extra) for dependency_extra in [""] + sorted(requirement.extras)]
+    return closure
@@ -0,0 +1,124 @@
+# Software License Agreement (GPL)
+#
+# \file      interpreter.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from . import run_command
+from .cache import get_cache_dir, hash_key
+
+# Runs inside the probed interpreter, so it must stay compatible with anything we might build a venv for
+_PROBE_SCRIPT = """
+import json, os, platform, sys, sysconfig
+os_release = {}
+try:
+    with open("/etc/os-release") as f:
+        for line in f:
+            if "=" in line:
+                k, v = line.rstrip().split("=", 1)
+                os_release[k] = v.strip('"')
+except (IOError, OSError):
+    pass
+modules = {}
+for module in ("venv", "ensurepip"):
+    try:
+        __import__(module)
+        modules[module] = True
+    except Exception:
+        modules[module] = False
+version = sys.implementation.version
+implementation_version = "{0.major}.{0.minor}.{0.micro}".format(version)
+if version.releaselevel != "final":
+    implementation_version += version.releaselevel[0] + str(version.serial)
+print(json.dumps({
+    "version": ".".join(str(v) for v in sys.version_info[:3]),
+    "sys_version": sys.version,
+    "implementation": sys.implementation.name,
+    "abiflags": getattr(sys, "abiflags", ""),
+    "cache_tag": sys.implementation.cache_tag,
+    "soabi": sysconfig.get_config_var("SOABI"),
+    "platform": sysconfig.get_platform(),
+    "libc": "".join(platform.libc_ver()),
+    "os": "{}-{}".format(os_release.get("ID", ""), os_release.get("VERSION_ID", "")),
+    "modules": modules,
+    "markers": {
+        "implementation_name": sys.implementation.name,
+        "implementation_version": implementation_version,
+        "os_name": os.name,
+        "platform_machine": platform.machine(),
+        "platform_release": platform.release(),
+        "platform_system": platform.system(),
+        "platform_version": platform.version(),
+        "python_full_version": platform.python_version(),
+        "platform_python_implementation": platform.python_implementation(),
+        "python_version": ".".join(platform.python_version_tuple()[:2]),
+        "sys_platform": sys.platform,
+    },
+}))
+"""
+
+# Probes made by this process, by interpreter
+_probes = {}
+
+
+def probe(python):
+    # type: (str) -> Dict[str, Any]
+    """
+    Describe the version, ABI and platform of a python interpreter, whether it provides venv and ensurepip, and the
+    environment its dependency markers are evaluated in.
+
+    Probes are cached by the interpreter's real path and modification time, in this process and in the shared cache
+    if enabled, so an interpreter is only started once until it's upgraded.
+    """
+    path = os.path.realpath(shutil.which(python) or python)
+    st = os.stat(path)
+    key = hash_key(path, st.st_mtime_ns, st.st_size, _PROBE_SCRIPT)
+    if key in _probes:
+        return _probes[key]
+
+    cache_dir = get_cache_dir("interpreters")
+    info = None if cache_dir is None else _read_probe(os.path.join(cache_dir, key + ".json"))
+    if info is None:
+        output = run_command([python, "-c", _PROBE_SCRIPT], check=True, capture_output=True).stdout
+        info = json.loads(output.decode("utf-8"))
+        if cache_dir is not None:
+            fd, temp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(info, f)
+            os.replace(temp, os.path.join(cache_dir, key + ".json"))
+
+    _probes[key] = info
+    return info
+
+
+def get_tag(info):
+    # type: (Dict[str, str]) -> str
+    """Build a filesystem-safe identifier of everything that makes a built wheel reusable for an interpreter."""
+    parts = [info["cache_tag"], info["soabi"] or "none", info["platform"], info["libc"], info["os"]]
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", "-".join(parts))
+
+
+def _read_probe(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
@@ -0,0 +1,96 @@
+# Software License Agreement (GPL)
+#
+# \file      layers.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import re
+
+from .distributions import find_site_packages, installed_distributions
+from .requirements import RequirementsConflict
+
+BASE_PTH = "_catkin_virtualenv_base.pth"
+
+_ADDSITEDIR_REGEX = re.compile(r"^import site; site\.addsitedir\((.*)\)$", flags=re.M)
+
+
+def write_base(venv_dir, base_venv_dir):
+    # type: (str, str) -> None
+    """
+    Stack a virtualenv on top of a base virtualenv.
+
+    A .pth file adds the base's site-packages (and, transitively, its own base) right after the virtualenv's own
+    site-packages, ahead of any system site packages. The base path needn't exist yet, e.g. when relocating into an
+    install space, but must use the same python version.
+    """
+    for site_packages in find_site_packages(venv_dir):
+        python_dir = os.path.basename(os.path.dirname(site_packages))
+        base_site_packages = os.path.join(base_venv_dir, "lib", python_dir, "site-packages")
+        pth = os.path.join(site_packages, BASE_PTH)
+        if os.path.exists(pth):
+            # Replace rather than rewrite, the file may be hardlinked from another virtualenv or the store
+            os.remove(pth)
+        with open(pth, "w") as f:
+            f.write("import site; site.addsitedir({!r})\n".format(base_site_packages))
+
+
+def base_site_packages(venv_dir):
+    # type: (str) -> List[str]
+    """Find the site-packages directories of all the virtualenvs a virtualenv is stacked on, nearest first."""
+    result = []
+    queue = find_site_packages(venv_dir)
+    while queue:
+        pth = os.path.join(queue.pop(0), BASE_PTH)
+        if not os.path.exists(pth):
+            continue
+        with open(pth, "r") as f:
+            for match in _ADDSITEDIR_REGEX.finditer(f.read()):
+                path = match.group(1).strip("'\"")
+                if path not in result:
+                    result.append(path)
+                    queue.append(path)
+    return result
+
+
+def check_base(venv_dir, base_venv_dir, requirements):
+    # type: (str, str, List[RequirementLine]) -> None
+    """Make sure a base virtualenv is usable, and that requirements don't contradict what's installed in it."""
+    for site_packages in find_site_packages(venv_dir):
+        python_dir = os.path.basename(os.path.dirname(site_packages))
+        if not os.path.isdir(os.path.join(base_venv_dir, "lib", python_dir, "site-packages")):
+            raise RuntimeError(
+                "Base virtualenv {} has no {} site-packages, both virtualenvs must use the same interpreter".format(
+                    base_venv_dir, python_dir
+                )
+            )
+
+    base = installed_distributions(find_site_packages(base_venv_dir) + base_site_packages(base_venv_dir))
+    conflicts = []
+    for line in requirements:
+        distribution = base.get(line.name)
+        if distribution is None or line.requirement.marker is not None:
+            continue
+        if line.requirement.url or not line.requirement.specifier.contains(distribution.version, prereleases=True):
+            conflicts.append(
+                "  {} ({}) vs. {}=={} ({})".format(
+                    line.line, line.source, distribution.name, distribution.version, distribution.metadata_dir
+                )
+            )
+
+    if conflicts:
+        raise RequirementsConflict(
+            "Requirements conflict with base virtualenv {}:\n{}".format(base_venv_dir, "\n".join(conflicts))
+        )
@@ -0,0 +1,106 @@
+# Software License Agreement (GPL)
+#
+# \file      lock_check.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import sys
+
+from packaging.utils import canonicalize_name
+
+from . import layers
+from .distributions import find_site_packages, installed_distributions
+from .requirements import RequirementsFile
+
+# pip-compile leaves these out of lock files unless --allow-unsafe is given
+UNSAFE_DISTRIBUTIONS = {"distribute", "pip", "setuptools"}
+
+logger = logging.getLogger(__name__)
+
+
+def check_locked(requirements, venv_dir):
+    # type: (str, str) -> Optional[List[str]]
+    """
+    Statically check whether a requirements file is fully locked, using the metadata installed in a virtualenv.
+
+    A file is fully locked if every line is pinned with ==, and the pins cover the dependency closure of the installed
+    distributions with versions satisfying every dependency. Returns the problems found, if any, or None if that can't
+    be decided without running the resolver: for options, URLs, markers, unsafe distributions, names pip-compile
+    would normalize, or pins the virtualenv doesn't have installed.
+    """
+    site_packages = find_site_packages(venv_dir)
+    python_dir = "python{}.{}".format(*sys.version_info[:2])
+    if [os.path.basename(os.path.dirname(path)) for path in site_packages] != [python_dir]:
+        # Dependency markers are evaluated for this interpreter, which must match the virtualenv's
+        return _undecided(requirements, "virtualenv doesn't use {}".format(python_dir))
+
+    parsed = RequirementsFile(requirements)
+    if parsed.options:
+        return _undecided(requirements, "it has options")
+
+    problems = []
+    pins = {}
+    for line in parsed.requirements:
+        requirement = line.requirement
+        if requirement is None or requirement.url or requirement.marker is not None:
+            return _undecided(requirements, "{} is not a plain requirement".format(line.line))
+        if line.name in UNSAFE_DISTRIBUTIONS or line.name != requirement.name.lower() or line.name in pins:
+            return _undecided(requirements, "pip-compile may rewrite {}".format(line.line))
+        if line.pin is None:
+            problems.append("{} is not pinned with ==".format(line.line))
+        pins[line.name] = line
+
+    distributions = installed_distributions(site_packages + layers.base_site_packages(venv_dir))
+    queue = [(name, extra) for name, line in pins.items() for extra in [""] + sorted(line.requirement.extras)]
+    visited = set()
+    while queue:
+        name, extra = queue.pop()
+        if (name, extra) in visited:
+            continue
+        visited.add((name, extra))
+
+        line = pins[name]
+        distribution = distributions.get(name)
+        if line.pin is None:
+            continue
+        if distribution is None or distribution.version != line.pin:
+            return _undecided(requirements, "{} is not installed in {}".format(line.line, venv_dir))
+
+        for dependency in distribution.requires:
+            if dependency.marker is not None and not dependency.marker.evaluate({"extra": extra}):
+                continue
+            dependency_name = canonicalize_name(dependency.name)
+            if dependency_name in UNSAFE_DISTRIBUTIONS:
+                continue
+            required_by = line.line if not extra else "{}[{}]".format(line.line, extra)
+            if dependency_name not in pins:
+                problems.append("{} (required by {}) is missing".format(dependency, required_by))
+                continue
+            pin = pins[dependency_name].pin
+            if pin is not None and not dependency.specifier.contains(pin, prereleases=True):
+                problems.append(
+                    "{} doesn't satisfy {} (required by {})".format(pins[dependency_name].line, dependency, required_by)
+                )
+            for dependency_extra in [""] + sorted(dependency.extras):
+                queue.append((dependency_name, dependency_extra))
+
+    return problems
+
+
+def _undecided(requirements, reason):
+    logger.info("Can't statically check whether {} is locked: {}".format(requirements, reason))
+    return None
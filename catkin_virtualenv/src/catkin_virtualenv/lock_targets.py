@@ -0,0 +1,144 @@
+# Software License Agreement (GPL)
+#
+# \file      lock_targets.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import logging
+import os
+import platform
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+from packaging.utils import canonicalize_name
+
+from . import run_command
+from .lock_check import UNSAFE_DISTRIBUTIONS
+
+# Default python version and glibc version of each distro release
+DISTRO_TARGETS = {
+    "bionic": ("3.6", "2.27"),
+    "focal": ("3.8", "2.31"),
+    "jammy": ("3.10", "2.35"),
+    "noble": ("3.12", "2.39"),
+    "buster": ("3.7", "2.28"),
+    "bullseye": ("3.9", "2.31"),
+    "bookworm": ("3.11", "2.36"),
+}
+
+# Legacy manylinux tags, and the glibc version they stand for
+_LEGACY_MANYLINUX = [("manylinux2014", 17), ("manylinux2010", 12), ("manylinux1", 5)]
+
+logger = logging.getLogger(__name__)
+
+
+class LockTarget:
+    def __init__(self, spec, arch=None):
+        """
+        Describe a distro to lock requirements for, from a spec like "jammy" or "jammy:3.11".
+
+        The python version defaults to the distro's system python.
+        """
+        self.codename, _, python_version = spec.partition(":")
+        if self.codename not in DISTRO_TARGETS:
+            raise RuntimeError(
+                "Unknown lock target {}, expected one of {}".format(self.codename, ", ".join(sorted(DISTRO_TARGETS)))
+            )
+        default_python_version, glibc_version = DISTRO_TARGETS[self.codename]
+        self.python_version = python_version or default_python_version
+        self.glibc_version = glibc_version
+        self.arch = arch or platform.machine()
+
+    @property
+    def platforms(self):
+        # type: () -> List[str]
+        """List the wheel platform tags installable on the target, pip doesn't expand manylinux tags by itself."""
+        glibc_minor = int(self.glibc_version.split(".")[1])
+        platforms = ["manylinux_2_{}_{}".format(minor, self.arch) for minor in range(glibc_minor, 4, -1)]
+        platforms += ["{}_{}".format(tag, self.arch) for tag, minor in _LEGACY_MANYLINUX if minor <= glibc_minor]
+        return platforms
+
+    def __str__(self):
+        return "{} (python {}, glibc {}, {})".format(self.codename, self.python_version, self.glibc_version, self.arch)
+
+
+def lock_targets(python, input_requirements, output_requirements, targets, extra_pip_args, jobs=None):
+    # type: (str, str, Callable[[LockTarget], str], List[LockTarget], List[str], Optional[int]) -> None
+    """
+    Resolve input requirements for several distros concurrently, writing a lock file for each.
+
+    Each target is resolved by a separate `pip install --dry-run` of the given interpreter, using pip's python version
+    and platform targeting. Only wheels can be considered for another platform, and pip evaluates environment markers
+    for the interpreter it runs on rather than the target, so markers depending on the python version may resolve
+    differently than on the target itself.
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            (target, executor.submit(_resolve, python, input_requirements, target, extra_pip_args))
+            for target in targets
+        ]
+
+    errors = []
+    for target, future in futures:
+        try:
+            lines = lock_lines(future.result())
+        except Exception as exc:
+            errors.append("{}: {}".format(target, exc))
+            continue
+        with open(output_requirements(target), "w") as f:
+            f.write("# Locked for {} from {}\n".format(target, os.path.basename(input_requirements)))
+            f.writelines(line + "\n" for line in lines)
+        logger.info("Wrote lock file for {} to {}".format(target, output_requirements(target)))
+
+    if errors:
+        raise RuntimeError("Failed to lock requirements for:\n" + "\n".join(errors))
+
+
+def _resolve(python, input_requirements, target, extra_pip_args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        report = os.path.join(work_dir, "report.json")
+        command = [python, "-m", "pip", "install", "--dry-run", "--ignore-installed", "--quiet", "--report", report]
+        command += ["--target", os.path.join(work_dir, "target"), "--only-binary=:all:", "--implementation", "cp"]
+        command += ["--python-version", target.python_version]
+        for platform_tag in target.platforms:
+            command += ["--platform", platform_tag]
+        command += extra_pip_args + ["-r", input_requirements]
+
+        result = run_command(command, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip())
+
+        with open(report, "r") as f:
+            return json.load(f)["install"]
+
+
+def lock_lines(installs):
+    # type: (List[Dict]) -> List[str]
+    """
+    Format the distributions of a pip installation report as pip-compile would lock them.
+
+    Names are normalized and sorted, and unsafe distributions (e.g. setuptools) are left out, only named in a comment.
+    """
+    pins = {}
+    for install in installs:
+        pins[canonicalize_name(install["metadata"]["name"])] = install["metadata"]["version"]
+    unsafe = sorted(name for name in pins if name in UNSAFE_DISTRIBUTIONS)
+    lines = ["{}=={}".format(name, version) for name, version in sorted(pins.items()) if name not in unsafe]
+    if unsafe:
+        lines += ["", "# The following packages are considered to be unsafe in a requirements file:"]
+        lines += ["# {}".format(name) for name in unsafe]
+    return lines
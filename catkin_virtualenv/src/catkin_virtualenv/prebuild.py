@@ -0,0 +1,229 @@
+# Software License Agreement (GPL)
+#
+# \file      prebuild.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from catkin_pkg.packages import find_packages
+
+from . import run_command, interpreter
+from .cache import hash_key
+from .collect_requirements import collect_requirements
+from .requirements import RequirementsFile
+from .venv import Virtualenv
+
+logger = logging.getLogger(__name__)
+
+
+def install_key(python, use_system_packages, requirements, extra_pip_args, options=None):
+    # type: (str, bool, List[str], List[str], Optional[Dict]) -> str
+    """
+    Compute the key of a virtualenv built by installing requirements, as venv_install would.
+
+    The key covers the base interpreter, whether system packages are visible, the content of the requirements in order,
+    pip args, and any further install options.
+    """
+    contents = []
+    for path in requirements:
+        with open(path, "r") as f:
+            contents.append(f.read())
+    return hash_key(
+        os.path.realpath(shutil.which(python) or python),
+        interpreter.get_tag(interpreter.probe(python)),
+        use_system_packages,
+        contents,
+        extra_pip_args,
+        options or {},
+    )
+
+
+def uses_system_packages(venv_dir):
+    # type: (str) -> bool
+    with open(os.path.join(venv_dir, "pyvenv.cfg"), "r") as f:
+        for line in f:
+            key, _, value = line.partition("=")
+            if key.strip() == "include-system-site-packages":
+                return value.strip().lower() == "true"
+    return False
+
+
+def find_venv_packages(source_dirs, index):
+    # type: (List[str], ManifestIndex) -> List[str]
+    """Find the packages under source_dirs that build a virtualenv, adding every package found to the index."""
+    names = []
+    for source_dir in source_dirs:
+        for path, package in find_packages(source_dir).items():
+            index.add(os.path.join(source_dir, path, "package.xml"), package)
+            dependencies = [dependency.name for dependency in package.build_depends + package.buildtool_depends]
+            if "catkin_virtualenv" in dependencies:
+                names.append(package.name)
+    return sorted(names)
+
+
+class Prebuilder:
+    def __init__(
+        self, cache, python, use_system_packages, extra_pip_args, jobs, template_cache=None, wheel_cache=None,
+        wheelhouse=None,
+    ):
+        """
+        Build the virtualenvs of a whole workspace ahead of catkin, into a VenvCache venv_install picks them up from.
+
+        Virtualenvs are built with venv_install's defaults, so packages overriding those (e.g. to merge requirements)
+        are built by catkin as usual. Packages with the same requirements share a build. Before building, every pin
+        of every fully locked requirements file is downloaded (or built from source) once into a shared wheelhouse,
+        which fully locked virtualenvs then install from without touching the package index. Given a Wheelhouse, pins
+        that only have an sdist are first built into it in parallel, so they're never built again.
+        """
+        self.cache = cache
+        self.python = python
+        self.use_system_packages = use_system_packages
+        self.extra_pip_args = extra_pip_args
+        self.jobs = jobs
+        self.template_cache = template_cache
+        self.wheel_cache = wheel_cache
+        self.wheelhouse = wheelhouse
+
+    def prebuild(self, packages, index):
+        # type: (List[str], ManifestIndex) -> Dict[str, str]
+        """Prebuild the virtualenvs of packages, returning the outcome for each."""
+        outcomes = OrderedDict()
+        builds = OrderedDict()
+        for package in packages:
+            requirements = collect_requirements(package, index=index)
+            missing = [path for path in requirements if not os.path.exists(path)]
+            if not requirements or missing:
+                logger.info("Not prebuilding {}, missing requirements {}".format(package, missing))
+                outcomes[package] = "skipped"
+                continue
+            key = install_key(self.python, self.use_system_packages, requirements, self.extra_pip_args)
+            if key in self.cache:
+                outcomes[package] = "cached"
+                continue
+            builds.setdefault(key, (requirements, []))[1].append(package)
+
+        if not builds:
+            return outcomes
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            wheelhouse = os.path.join(work_dir, "wheelhouse")
+            all_requirements = {path for requirements, _ in builds.values() for path in requirements}
+            locked = set(self._download(work_dir, wheelhouse, sorted(all_requirements)))
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = []
+                for key, (requirements, names) in builds.items():
+                    fully_locked = all(path in locked for path in requirements)
+                    futures.append((names, executor.submit(self._build, key, requirements, fully_locked, wheelhouse)))
+                for names, future in futures:
+                    try:
+                        outcome = "cached" if future.result() else "built"
+                    except Exception as exc:
+                        logger.error("Failed to prebuild virtualenv for {}: {}".format(", ".join(names), exc))
+                        outcome = "failed"
+                    outcomes.update((name, outcome) for name in names)
+
+        return outcomes
+
+    def _download(self, work_dir, wheelhouse, requirements):
+        """Download every pin of the fully locked requirements into the wheelhouse, returning those requirements."""
+        pins = {}
+        locked = []
+        for path in requirements:
+            lines = RequirementsFile(path).requirements
+            if lines and all(line.pin is not None for line in lines):
+                locked.append(path)
+                for line in lines:
+                    pins.setdefault(str(line.requirement), line.name)
+        if not pins:
+            return []
+
+        # A distribution may be pinned to different versions by different packages, so download in rounds that pin
+        # each distribution at most once
+        rounds = []
+        for requirement, name in sorted(pins.items()):
+            for pinned_names in rounds:
+                if name not in pinned_names:
+                    pinned_names[name] = requirement
+                    break
+            else:
+                rounds.append({name: requirement})
+
+        bootstrap = Virtualenv(os.path.join(work_dir, "bootstrap"))
+        bootstrap.initialize(
+            self.python, self.use_system_packages, self.extra_pip_args, template_cache=self.template_cache
+        )
+        python = os.path.join(bootstrap.path, "bin", "python")
+        if self.wheelhouse is not None:
+            self.wheelhouse.prebuild(python, locked, self.extra_pip_args)
+        chunks = []
+        for pinned_names in rounds:
+            pinned_requirements = sorted(pinned_names.values())
+            chunks += [pinned_requirements[i::self.jobs] for i in range(min(self.jobs, len(pinned_requirements)))]
+        logger.info("Downloading {} pinned requirements of {} locked files".format(len(pins), len(locked)))
+
+        def download(number, chunk):
+            chunk_requirements = os.path.join(work_dir, "download-{}.txt".format(number))
+            with open(chunk_requirements, "w") as f:
+                f.writelines(requirement + "\n" for requirement in chunk)
+            command = [python, "-m", "pip", "wheel", "--no-deps", "-w", wheelhouse] + self._wheelhouse_args()
+            if self.wheel_cache is not None:
+                self.wheel_cache.run_pip(command + self.extra_pip_args + ["-r", chunk_requirements], python)
+            else:
+                run_command(command + self.extra_pip_args + ["--no-cache-dir", "-r", chunk_requirements], check=True)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(download, number, chunk) for number, chunk in enumerate(chunks)]
+            failed = False
+            for future in futures:
+                try:
+                    future.result()
+                except subprocess.CalledProcessError as exc:
+                    logger.warning("Failed to download pinned requirements, installing from the index: {}".format(exc))
+                    failed = True
+        return [] if failed else locked
+
+    def _build(self, key, requirements, locked, wheelhouse):
+        def build(path):
+            venv = Virtualenv(path)
+            venv.initialize(
+                self.python,
+                self.use_system_packages,
+                self.extra_pip_args,
+                template_cache=self.template_cache,
+                wheel_cache=self.wheel_cache,
+            )
+            if locked:
+                try:
+                    venv.install(requirements, self.extra_pip_args + ["--no-index", "--find-links", wheelhouse])
+                    return
+                except subprocess.CalledProcessError:
+                    logger.warning("Locked requirements {} are incomplete, installing from the index".format(
+                        ", ".join(requirements)))
+            find_links = ["--find-links", wheelhouse] + self._wheelhouse_args()
+            venv.install(requirements, self.extra_pip_args + find_links, self.wheel_cache)
+
+        return self.cache.build(key, build)
+
+    def _wheelhouse_args(self):
+        return [] if self.wheelhouse is None else self.wheelhouse.find_links_args(self.python)
@@ -0,0 +1,160 @@
+# Software License Agreement (GPL)
+#
+# \file      profile.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import atexit
+import json
+import os
+import sys
+import time
+
+# Imported by catkin_install_python launchers, so this module must only depend on the standard library
+PROFILE_DIR_ENV = "CATKIN_VIRTUALENV_PROFILE"
+
+
+class Profiler:
+    def __init__(self, output_dir, program):
+        """
+        Profile the startup of a program run by a catkin_install_python launcher.
+
+        Records how long the interpreter took to start, and from then on the time spent executing each module as it is
+        first loaded (like -X importtime), however the import was made: import statements, submodules loaded through
+        a from-import, or importlib.import_module. Also records the time until the program itself starts running.
+        Modules imported before profiling started, by the interpreter or the profiler itself, are only listed. The
+        trace is written to output_dir when the program starts, and again at exit.
+        """
+        self.started = _process_uptime()
+        self.trace = {
+            "program": program,
+            "pid": os.getpid(),
+            "argv": sys.argv[1:],
+            "interpreter_startup": self.started,
+            "script_start": None,
+            "preloaded": sorted(sys.modules),
+            "imports": [],
+        }
+        self.path = os.path.join(output_dir, "{}-{}.json".format(program, os.getpid()))
+        os.makedirs(output_dir, exist_ok=True)
+
+        self._stack = []
+        sys.meta_path.insert(0, _TimingFinder(self))
+        atexit.register(self.write)
+
+    def script_started(self):
+        """Mark the point where the launcher hands over to the program."""
+        self.trace["script_start"] = _process_uptime()
+        self.write()
+
+    def write(self):
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.trace, f)
+        os.replace(temp, self.path)
+
+    def _timed_exec(self, loader, module):
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cumulative
+            self.trace["imports"].append({
+                "module": module.__spec__.name,
+                "self": cumulative - children,
+                "cumulative": cumulative,
+                "depth": len(self._stack),
+            })
+
+
+class _TimingFinder:
+    """Find modules through the rest of sys.meta_path, handing out loaders that time module execution."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(self.profiler, spec.loader)
+                return spec
+        return None
+
+    def invalidate_caches(self):
+        pass
+
+
+class _TimingLoader:
+    def __init__(self, profiler, loader):
+        self.profiler = profiler
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Hand the module its real loader, so the profiler is invisible to the module and anything inspecting it
+        module.__loader__ = self.loader
+        module.__spec__.loader = self.loader
+        self.profiler._timed_exec(self.loader, module)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+def load_traces(paths):
+    # type: (List[str]) -> List[Dict]
+    """Load profiler traces from files, or every trace in a directory."""
+    traces = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".json"))
+        else:
+            files = [path]
+        for trace_file in files:
+            with open(trace_file, "r") as f:
+                traces.append(json.load(f))
+    return traces
+
+
+def rank_imports(traces, key="self"):
+    # type: (List[Dict], str) -> List[Tuple[str, float, float, int]]
+    """Rank modules by total self or cumulative import time across traces, as (module, total, max, count)."""
+    totals = {}
+    for trace in traces:
+        for entry in trace["imports"]:
+            total, longest, count = totals.get(entry["module"], (0.0, 0.0, 0))
+            totals[entry["module"]] = (total + entry[key], max(longest, entry[key]), count + 1)
+    return sorted(
+        ((module, total, longest, count) for module, (total, longest, count) in totals.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+
+
+def _process_uptime():
+    """Seconds since this process was started, per the kernel."""
+    with open("/proc/self/stat", "r") as f:
+        # The command name may contain spaces, fields are only unambiguous after its closing parenthesis
+        start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
@@ -18,63 +18,126 @@
 # along with dh-virtualenv. If not, see
 # <http://www.gnu.org/licenses/>.
 
+import logging
 import os
 import re
+import tempfile
 
-from . import run_command
+from concurrent.futures import ThreadPoolExecutor
 
 PYTHON_INTERPRETERS = ["python", "pypy", "ipy", "jython"]
-_PYTHON_INTERPRETERS_REGEX = r"\(" + r"\|".join(PYTHON_INTERPRETERS) + r"\)"
-
-
-def find_script_files(venv_dir):
-    """Find list of files containing python shebangs in the bin directory. """
-    command = [
-        "grep",
-        "-l",
-        "-r",
-        "-e",
-        r"^#!.*bin/\(env \)\?{0}".format(_PYTHON_INTERPRETERS_REGEX),
-        "-e",
-        r"^'''exec.*bin/{0}".format(_PYTHON_INTERPRETERS_REGEX),
-        os.path.join(venv_dir, "bin"),
-    ]
-    files = run_command(command, check=True, capture_output=True).stdout
-    return {f for f in files.decode("utf-8").strip().split("\n") if f}
-
-
-def fix_shebangs(venv_dir, target_dir):
-    """Translate /usr/bin/python and /usr/bin/env python shebang
-    lines to point to our virtualenv python.
-    """
-    pythonpath = os.path.join(target_dir, "bin/python")
-    for f in find_script_files(venv_dir):
-        regex = (
-            r"s-^#!.*bin/\(env \)\?{names}\"\?-#!{pythonpath}-;" r"s-^'''exec'.*bin/{names}-'''exec' {pythonpath}-"
-        ).format(names=_PYTHON_INTERPRETERS_REGEX, pythonpath=re.escape(pythonpath))
-        run_command(["sed", "-i", regex, f], check=True)
+_PYTHON_INTERPRETERS_REGEX = "(" + "|".join(PYTHON_INTERPRETERS) + ")"
+
+_SHEBANG_REGEX = re.compile(r'^#!.*bin/(env )?{0}"?'.format(_PYTHON_INTERPRETERS_REGEX).encode(), flags=re.M)
+_EXEC_REGEX = re.compile(r"^'\'\'exec'.*bin/{0}".format(_PYTHON_INTERPRETERS_REGEX).encode(), flags=re.M)
+_BYTECODE_REGEX = re.compile(r".*\.py[co]")
+
+# Interpreter references only ever live in the first few lines of a script
+_HEADER_SIZE = 1024
+_HEADER_LINES = 3
+
+_ACTIVATE_SETTINGS = [
+    ('VIRTUAL_ENV="{0}"', r"^VIRTUAL_ENV=.*$", "activate"),
+    ('setenv VIRTUAL_ENV "{0}"', r"^setenv VIRTUAL_ENV.*$", "activate.csh"),
+    ('set -gx VIRTUAL_ENV "{0}"', r"^set -gx VIRTUAL_ENV.*$", "activate.fish"),
+]
+_PYVENV_CFG_REGEX = re.compile(r"^(command\s*=.*\s)\S+$", flags=re.M)
 
+logger = logging.getLogger(__name__)
+
+
+def relocate(venv_dir, target_dir, delete_bytecode=True, jobs=None):
+    # type: (str, str, bool, Optional[int]) -> List[str]
+    """
+    Rewrite every path embedded in a virtualenv to point at target_dir, returning the files that changed.
 
-def fix_activate_path(venv_dir, target_dir):
-    """Replace the `VIRTUAL_ENV` path in bin/activate to reflect the
-    post-install path of the virtualenv.
+    Script shebangs and '\'\'exec' trampolines in bin/, activate scripts and pyvenv.cfg are all fixed in one pass,
+    in parallel. Only the first bytes of each script are read unless it needs rewriting, and rewritten files are
+    replaced rather than modified in place. Since bytecode embeds absolute paths, it's deleted if anything changed;
+    relocating a virtualenv to where it already points is a no-op.
     """
-    activate_settings = [
-        ['VIRTUAL_ENV="{0}"'.format(target_dir), r"^VIRTUAL_ENV=.*$", "activate"],
-        ['setenv VIRTUAL_ENV "{0}"'.format(target_dir), r"^setenv VIRTUAL_ENV.*$", "activate.csh"],
-        ['set -gx VIRTUAL_ENV "{0}"'.format(target_dir), r"^set -gx VIRTUAL_ENV.*$", "activate.fish"],
-    ]
-
-    for activate_args in activate_settings:
-        virtualenv_path = activate_args[0]
-        pattern = re.compile(activate_args[1], flags=re.M)
-        activate_file = activate_args[2]
-
-        with open(os.path.join(venv_dir, "bin", activate_file), "r+") as fh:
-            content = pattern.sub(virtualenv_path, fh.read())
-            fh.seek(0)
-            fh.truncate()
+    pythonpath = os.fsencode(os.path.join(target_dir, "bin/python"))
+    bin_dir = os.path.join(venv_dir, "bin")
+
+    tasks = []
+    bytecode = []
+    for root, _, files in os.walk(venv_dir):
+        for f in files:
+            path = os.path.join(root, f)
+            if _BYTECODE_REGEX.match(f):
+                bytecode.append(path)
+            elif root == bin_dir and f in [settings[2] for settings in _ACTIVATE_SETTINGS]:
+                tasks.append((_fix_activate, path, target_dir))
+            elif root.startswith(bin_dir) and not os.path.islink(path):
+                tasks.append((_fix_script, path, pythonpath))
+    tasks.append((_fix_pyvenv_cfg, os.path.join(venv_dir, "pyvenv.cfg"), target_dir))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(lambda task: task[1] if task[0](task[1], task[2]) else None, tasks))
+    changed = [path for path in results if path is not None]
+
+    if changed and delete_bytecode:
+        for path in bytecode:
+            os.remove(path)
+
+    logger.info("Relocated {} to {}, {} files changed".format(venv_dir, target_dir, len(changed)))
+    return changed
+
+
+def _fix_script(path, pythonpath):
+    with open(path, "rb") as fh:
+        head = fh.read(_HEADER_SIZE)
+        if not head.startswith(b"#!"):
+            return False
+
+        lines = head.split(b"\n", _HEADER_LINES)
+        header = b"\n".join(lines[:_HEADER_LINES])
+        new_header = _SHEBANG_REGEX.sub(lambda _: b"#!" + pythonpath, header, count=1)
+        new_header = _EXEC_REGEX.sub(lambda _: b"'\'\'exec' " + pythonpath, new_header)
+        if new_header == header:
+            return False
+
+        rest = head[len(header):] + fh.read()
+    _replace(path, new_header + rest)
+    return True
+
+
+def _fix_activate(path, target_dir):
+    if not os.path.exists(path):
+        return False
+    settings = next(settings for settings in _ACTIVATE_SETTINGS if settings[2] == os.path.basename(path))
+    with open(path, "r") as fh:
+        content = fh.read()
+    new_content = re.sub(settings[1], lambda _: settings[0].format(target_dir), content, flags=re.M)
+    if new_content == content:
+        return False
+    _replace(path, new_content.encode())
+    return True
+
+
+def _fix_pyvenv_cfg(path, target_dir):
+    if not os.path.exists(path):
+        return False
+    with open(path, "r") as fh:
+        content = fh.read()
+    new_content = _PYVENV_CFG_REGEX.sub(lambda match: match.group(1) + target_dir, content)
+    if new_content == content:
+        return False
+    _replace(path, new_content.encode())
+    return True
+
+
+def _replace(path, content):
+    """Atomically replace a file's content, keeping its mode but breaking any hardlinks."""
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".relocate-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
             fh.write(content)
+        os.chmod(temp, os.stat(path).st_mode & 0o7777)
+        os.replace(temp, path)
+    except Exception:
+        os.remove(temp)
+        raise
 
 
 def fix_local_symlinks(venv_dir):
@@ -0,0 +1,227 @@
+# Software License Agreement (GPL)
+#
+# \file      requirements.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import re
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+_COMMENT_REGEX = re.compile(r"(^|\s+)#.*$")
+_OPTION_REGEX = re.compile(r"^(-[-\w]+)(?:=|\s+)?(.*)$")
+_INLINE_OPTION_REGEX = re.compile(r"\s+--?[a-z].*$")
+_INLINE_OPTION_VALUE_REGEX = re.compile(r"(--?[a-z][\w-]*)(?:=|\s+)(\S+)")
+# Options whose value is a local path, which has to be made absolute once requirements leave their source file
+_PATH_OPTIONS = ("-c", "--constraint", "-f", "--find-links", "-e", "--editable")
+
+logger = logging.getLogger(__name__)
+
+
+class RequirementsConflict(RuntimeError):
+    pass
+
+
+class RequirementLine:
+    def __init__(self, line, source, requirement=None):
+        """A single requirement specifier, remembering which file declared it."""
+        self.line = line
+        self.source = source
+        self.requirement = requirement
+
+    @property
+    def key(self):
+        """Identify the project this line constrains, or the line itself for URLs, paths and editables."""
+        if self.requirement is None:
+            return self.line
+        return canonicalize_name(self.requirement.name), str(self.requirement.marker or "")
+
+    @property
+    def name(self):
+        return None if self.requirement is None else canonicalize_name(self.requirement.name)
+
+    @property
+    def pin(self):
+        """Return the exactly pinned version, if any."""
+        if self.requirement is None or self.requirement.url:
+            return None
+        specifiers = list(self.requirement.specifier)
+        if len(specifiers) == 1 and specifiers[0].operator in ("==", "==="):
+            return specifiers[0].version
+        return None
+
+    @property
+    def options(self):
+        """Return the options given after the requirement, e.g. --hash, as option=value strings."""
+        match = _INLINE_OPTION_REGEX.search(self.line)
+        if self.requirement is None or match is None:
+            return []
+        return ["{}={}".format(option, value) for option, value in _INLINE_OPTION_VALUE_REGEX.findall(match.group(0))]
+
+    def with_options(self, options):
+        """Return this line with additional options, e.g. the hashes another file gives for the same pin."""
+        added = [option for option in options if option not in self.options]
+        if not added:
+            return self
+        return RequirementLine(" ".join([self.line] + added), self.source, self.requirement)
+
+    def satisfies(self, other):
+        """Whether this line's pin satisfies another line, so installing both in sequence keeps the pin."""
+        if self.pin is None or other.requirement is None or other.requirement.url or other.pin is not None:
+            return False
+        return other.requirement.extras <= self.requirement.extras and other.requirement.specifier.contains(
+            self.pin, prereleases=True
+        )
+
+    def conflicts_with(self, other):
+        if self.requirement is None or other.requirement is None:
+            return False
+        return (self.requirement.specifier, self.requirement.url) != (
+            other.requirement.specifier,
+            other.requirement.url,
+        )
+
+    def __str__(self):
+        return self.line
+
+
+class RequirementsFile:
+    def __init__(self, path):
+        """Parse a pip requirements file, following nested -r includes."""
+        self.path = path
+        self.options = []
+        self.requirements = []
+        self._parse(path)
+
+    def _parse(self, path):
+        base_dir = os.path.dirname(os.path.abspath(path))
+        with open(path, "r") as f:
+            content = f.read().replace("\\\n", "")
+
+        for line in content.splitlines():
+            line = _COMMENT_REGEX.sub("", line).strip()
+            if not line:
+                continue
+
+            if line.startswith("-"):
+                option, value = _OPTION_REGEX.match(line).groups()
+                if option in ("-r", "--requirement"):
+                    self._parse(os.path.join(base_dir, value))
+                elif option in _PATH_OPTIONS and "://" not in value:
+                    self.options.append("{} {}".format(option, os.path.normpath(os.path.join(base_dir, value))))
+                else:
+                    self.options.append(line)
+                continue
+
+            if _is_local_path(line):
+                self.requirements.append(RequirementLine(os.path.normpath(os.path.join(base_dir, line)), path))
+                continue
+
+            try:
+                requirement = Requirement(_INLINE_OPTION_REGEX.sub("", line))
+            except InvalidRequirement:
+                logger.info("Treating {} from {} as an opaque requirement".format(line, path))
+                requirement = None
+            self.requirements.append(RequirementLine(line, path, requirement))
+
+
+class MergedRequirements:
+    def __init__(self, paths, overrides=(), strict=False):
+        """
+        Merge several requirements files into a single set, for installing in one pip transaction.
+
+        Files are given in installation order, and conflicting pins resolve as if each file had been installed in
+        sequence: later files win, unless an earlier pin already satisfies them. Inline options of identical
+        requirements, such as hashes, are combined. Files listed in overrides (i.e. the requirements of the package
+        owning the virtualenv) are expected to override their dependencies. Any other conflict is reported up front,
+        naming the offending files, and raises a RequirementsConflict in strict mode.
+        """
+        overrides = {os.path.normpath(path) for path in overrides}
+        self.options = []
+        self.requirements = []
+        self.overridden = []
+        self.conflicts = []
+        index = {}
+
+        for path in paths:
+            override = os.path.normpath(path) in overrides
+            parsed = RequirementsFile(path)
+
+            for option in parsed.options:
+                if option not in self.options:
+                    self.options.append(option)
+
+            for line in parsed.requirements:
+                existing = index.get(line.key)
+                if existing is None:
+                    index[line.key] = len(self.requirements)
+                    self.requirements.append((line, override))
+                    continue
+
+                previous, previous_override = self.requirements[existing]
+                if not previous.conflicts_with(line):
+                    self.requirements[existing] = (previous.with_options(line.options), previous_override)
+                    continue
+                if previous.satisfies(line):
+                    # pip leaves an installed version alone if it satisfies a later requirement
+                    logger.info(
+                        "{} ({}) keeps {} ({})".format(line.line, line.source, previous.line, previous.source)
+                    )
+                    continue
+                if previous_override and not override:
+                    self.overridden.append((line, previous))
+                    continue
+
+                if override and not previous_override:
+                    self.overridden.append((previous, line))
+                else:
+                    self.conflicts.append((previous, line))
+                self.requirements[existing] = (line, override)
+
+        for replaced, replacement in self.overridden:
+            logger.info(
+                "{} ({}) overrides {} ({})".format(replacement.line, replacement.source, replaced.line, replaced.source)
+            )
+
+        if self.conflicts:
+            message = "Conflicting requirements:\n" + "\n".join(
+                "  {} ({}) vs. {} ({})".format(a.line, a.source, b.line, b.source) for a, b in self.conflicts
+            )
+            if strict:
+                raise RequirementsConflict(message)
+            logger.warning(message + "\nThe latter of each pair will be installed.")
+
+        self.requirements = [line for line, _ in self.requirements]
+
+    def write(self, path):
+        """Write the merged set out as a single requirements file."""
+        write_requirements(path, self.options, self.requirements)
+
+
+def write_requirements(path, options, requirements):
+    # type: (str, List[str], List[RequirementLine]) -> None
+    """Write options and requirement lines out as a requirements file, annotated with where each line came from."""
+    with open(path, "w") as f:
+        for option in options:
+            f.write(option + "\n")
+        for line in requirements:
+            f.write("{}  # from {}\n".format(line.line, line.source))
+
+
+def _is_local_path(value):
+    return value.startswith((".", "/")) and "://" not in value
@@ -0,0 +1,155 @@
+# Software License Agreement (GPL)
+#
+# \file      resolution_cache.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import re
+import tempfile
+import time
+
+from . import interpreter
+from .cache import file_lock, hash_key
+
+TTL_ENV = "CATKIN_VIRTUALENV_RESOLUTION_TTL"
+MAX_SIZE_ENV = "CATKIN_VIRTUALENV_RESOLUTION_CACHE_MB"
+INDEX_SNAPSHOT_ENV = "CATKIN_VIRTUALENV_INDEX_SNAPSHOT"
+
+_INCLUDE_REGEX = re.compile(r"^\s*(?:-r|--requirement|-c|--constraint)(?:=|\s+)(\S+)", flags=re.M)
+
+logger = logging.getLogger(__name__)
+
+
+class ResolutionCache:
+    DEFAULT_TTL = 24 * 60 * 60
+    DEFAULT_MAX_SIZE_MB = 64
+
+    def __init__(self, path, ttl=None, max_size_mb=None):
+        """
+        Manage a cache of pip-compile output shared between builds.
+
+        Entries are keyed on the content of the input requirements (and any files they include), any existing output
+        pip-compile would take pins from, the interpreter and platform, extra pip args, and an optional index snapshot
+        id from CATKIN_VIRTUALENV_INDEX_SNAPSHOT that should change whenever the package index does. As packages keep
+        getting published, resolutions expire after ttl seconds regardless, and the least recently used entries are
+        evicted beyond max_size_mb.
+        """
+        self.path = path
+        if ttl is None:
+            ttl = int(os.environ.get(TTL_ENV, self.DEFAULT_TTL))
+        if max_size_mb is None:
+            max_size_mb = int(os.environ.get(MAX_SIZE_ENV, self.DEFAULT_MAX_SIZE_MB))
+        self.ttl = ttl
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = os.path.join(self.path, ".lock")
+
+    def key(self, python, input_requirements, extra_pip_args, output_requirements=None):
+        # type: (str, str, List[str], Optional[str]) -> str
+        """Compute the cache key of resolving input_requirements."""
+        snapshot = os.environ.get(INDEX_SNAPSHOT_ENV)
+        existing_output = None
+        if output_requirements is not None and os.path.exists(output_requirements):
+            with open(output_requirements, "r") as f:
+                existing_output = f.read()
+        return hash_key(
+            _read_inputs(input_requirements),
+            existing_output,
+            interpreter.get_tag(interpreter.probe(python)),
+            extra_pip_args,
+            snapshot,
+        )
+
+    def get(self, key):
+        # type: (str) -> Optional[str]
+        """Look up a resolution, refreshing its last use."""
+        entry = os.path.join(self.path, key + ".txt")
+        with file_lock(self._lock, shared=True):
+            try:
+                with open(entry, "r") as f:
+                    resolution = f.read()
+                age = time.time() - os.path.getmtime(entry)
+            except (IOError, OSError):
+                resolution = None
+            if resolution is not None and age > self.ttl:
+                logger.info("Resolution {} expired".format(entry))
+                resolution = None
+            if resolution is not None:
+                # Only bump the access time, the mtime tracks when the resolution was made
+                os.utime(entry, (time.time(), os.path.getmtime(entry)))
+
+        if resolution is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return resolution
+
+    def put(self, key, resolution):
+        # type: (str, str) -> None
+        entry = os.path.join(self.path, key + ".txt")
+        with file_lock(self._lock, shared=True):
+            fd, temp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(resolution)
+            os.replace(temp, entry)
+        self.evict()
+
+    def evict(self):
+        """Delete expired and least-recently-used resolutions until the cache fits in its size limit."""
+        with file_lock(self._lock, blocking=False) as acquired:
+            if not acquired:
+                logger.info("Resolution cache is in use, skipping eviction")
+                return
+
+            now = time.time()
+            entries = []
+            size = 0
+            for name in os.listdir(self.path):
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(self.path, name)
+                st = os.stat(path)
+                if now - st.st_mtime > self.ttl:
+                    os.remove(path)
+                    continue
+                entries.append((st.st_atime, st.st_size, path))
+                size += st.st_size
+
+            entries.sort()
+            for _, entry_size, path in entries:
+                if size <= self.max_size:
+                    break
+                os.remove(path)
+                size -= entry_size
+
+
+def _read_inputs(path, seen=None):
+    # type: (str, Optional[Set[str]]) -> List[str]
+    """Read a requirements file along with every requirements or constraints file it includes."""
+    seen = set() if seen is None else seen
+    path = os.path.abspath(path)
+    if path in seen:
+        return []
+    seen.add(path)
+    with open(path, "r") as f:
+        content = f.read()
+    contents = [content]
+    for include in _INCLUDE_REGEX.findall(content):
+        if "://" not in include:
+            contents += _read_inputs(os.path.join(os.path.dirname(path), include), seen)
+    return contents
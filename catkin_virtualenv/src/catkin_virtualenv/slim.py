@@ -0,0 +1,234 @@
+# Software License Agreement (GPL)
+#
+# \file      slim.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from . import run_command, interpreter
+from .distributions import dependency_closure, find_site_packages, installed_distributions
+
+# Matched against paths relative to the virtualenv, see _pattern_regex
+DEFAULT_EXCLUDE = [
+    "include/**",
+    "**/site-packages/*/tests/**",
+    "**/site-packages/*/test/**",
+    "**/site-packages/*/docs/**",
+    "**/site-packages/*/doc/**",
+    "**/*.c",
+    "**/*.cpp",
+    "**/*.h",
+    "**/*.hpp",
+    "**/*.pyx",
+    "**/*.pxd",
+    "**/*.dist-info/INSTALLER",
+    "**/*.dist-info/REQUESTED",
+    "**/*.dist-info/direct_url.json",
+]
+
+# Build tools every virtualenv gets, removed along with dependencies nothing else was installed for
+TOOL_DISTRIBUTIONS = ["pip", "pip-tools"]
+# Often imported without being declared as a dependency (e.g. pkg_resources), so never removed
+_KEEP_DISTRIBUTIONS = {"setuptools"}
+
+# Distribution metadata importlib.metadata and pkg_resources read, which no rule may remove
+_METADATA_DIR_REGEX = re.compile(r"\.(dist|egg)-info$")
+_PROTECTED_METADATA = (
+    "METADATA", "PKG-INFO", "RECORD", "entry_points.txt", "top_level.txt", "namespace_packages.txt",
+)
+_LICENSE_REGEX = re.compile(r"^(LICEN[CS]E|COPYING|NOTICE|AUTHORS)", flags=re.I)
+
+_ELF_MAGIC = b"\x7fELF"
+_SHARED_OBJECT_REGEX = re.compile(r"\.so(\.\d+)*$")
+
+logger = logging.getLogger(__name__)
+
+
+def slim(venv_dir, exclude=None, include=(), strip_debug=True, remove_tools=True, jobs=None):
+    # type: (str, Optional[List[str]], List[str], bool, bool, Optional[int]) -> Dict[str, int]
+    """
+    Remove whatever a virtualenv doesn't need at runtime, returning the bytes saved for each distribution.
+
+    Files matching an exclude pattern (DEFAULT_EXCLUDE by default) are deleted unless they also match an include
+    pattern. Patterns are matched against paths relative to the virtualenv: * and ? match within a directory, and **
+    across directories. Distribution metadata needed to look distributions up or uninstall them (METADATA, RECORD,
+    entry points, licenses...) is always kept.
+    Unless disabled, pip and pip-tools are removed along with any dependencies that weren't requested in their own
+    right, and debug symbols are stripped from shared objects. Files are only ever deleted or replaced, never modified,
+    so slimming a staged virtualenv doesn't touch the one it was staged from.
+    """
+    exclude = [_pattern_regex(pattern) for pattern in (DEFAULT_EXCLUDE if exclude is None else exclude)]
+    include = [_pattern_regex(pattern) for pattern in include]
+    venv_dir = os.path.normpath(venv_dir)
+    owners = {}
+    site_packages = find_site_packages(venv_dir)
+    distributions = installed_distributions(site_packages)
+    for distribution in distributions.values():
+        site_packages_dir = os.path.dirname(distribution.metadata_dir)
+        for path in distribution.files():
+            owners[os.path.normpath(os.path.join(site_packages_dir, path))] = distribution.name
+
+    saved = Counter()
+    removed_from = set()
+
+    if remove_tools:
+        environment = interpreter.probe(os.path.join(venv_dir, "bin", "python"))["markers"]
+        for name in sorted(_removable_tools(distributions, environment)):
+            distribution = distributions[name]
+            site_packages_dir = os.path.dirname(distribution.metadata_dir)
+            for path in distribution.files():
+                saved[name] += _remove(os.path.normpath(os.path.join(site_packages_dir, path)), removed_from)
+            if os.path.isdir(distribution.metadata_dir):
+                saved[name] += _directory_size(distribution.metadata_dir)
+                shutil.rmtree(distribution.metadata_dir)
+                removed_from.add(os.path.dirname(distribution.metadata_dir))
+
+    shared_objects = []
+    for root, dirs, files in os.walk(venv_dir):
+        for f in files:
+            path = os.path.join(root, f)
+            if os.path.islink(path):
+                continue
+            relative = os.path.relpath(path, venv_dir).replace(os.sep, "/")
+            if _excluded(relative, exclude, include):
+                saved[owners.get(path, "")] += _remove(path, removed_from)
+            elif strip_debug and _SHARED_OBJECT_REGEX.search(f):
+                shared_objects.append(path)
+
+    if shared_objects and strip_debug:
+        strip = shutil.which("strip")
+        if strip is None:
+            logger.warning("strip not found, not stripping debug symbols from shared objects")
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for path, stripped in zip(shared_objects, executor.map(lambda p: _strip(strip, p), shared_objects)):
+                    saved[owners.get(path, "")] += stripped
+
+    _remove_empty_dirs(venv_dir, removed_from)
+
+    saved = {name or "(unowned)": size for name, size in saved.items() if size}
+    logger.info("Slimmed {} by {} bytes".format(venv_dir, sum(saved.values())))
+    return saved
+
+
+def _removable_tools(distributions, environment):
+    """Find the build tools installed in a virtualenv, and their dependencies that nothing else needs."""
+    tools = {name for name in TOOL_DISTRIBUTIONS if name in distributions}
+    # pip marks the distributions it was asked to install, rather than pulled in as dependencies
+    requested = {name for name, distribution in distributions.items() if _requested(distribution)}
+    if not tools or not tools <= requested:
+        # Without markers, there's no telling what else was installed just for the tools
+        return tools
+    # REQUESTED doesn't say which extras were requested, so keep the dependencies of all of them
+    needed = dependency_closure(
+        (requested - tools) | _KEEP_DISTRIBUTIONS,
+        distributions,
+        extras={name: distribution.extras for name, distribution in distributions.items()},
+        environment=environment,
+    )
+    return dependency_closure(tools, distributions, environment=environment) - needed
+
+
+def _requested(distribution):
+    return os.path.exists(os.path.join(distribution.metadata_dir, "REQUESTED"))
+
+
+def _excluded(relative, exclude, include):
+    parts = relative.split("/")
+    if _LICENSE_REGEX.match(parts[-1]):
+        return False
+    if any(_METADATA_DIR_REGEX.search(part) for part in parts[:-1]):
+        if parts[-1] in _PROTECTED_METADATA or "licenses" in parts:
+            return False
+    return any(regex.match(relative) for regex in exclude) and not any(regex.match(relative) for regex in include)
+
+
+def _pattern_regex(pattern):
+    """
+    Compile a path pattern, where * and ? don't match across directories but ** does, and a leading **/ also matches
+    no directories at all.
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r"\Z")
+
+
+def _remove(path, removed_from):
+    try:
+        size = os.lstat(path).st_size
+        os.remove(path)
+    except OSError:
+        return 0
+    removed_from.add(os.path.dirname(path))
+    return size
+
+
+def _strip(strip, path):
+    """Strip debug symbols from a shared object, returning the bytes saved."""
+    with open(path, "rb") as f:
+        if f.read(4) != _ELF_MAGIC:
+            return 0
+    size = os.path.getsize(path)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".strip")
+    os.close(fd)
+    try:
+        if run_command([strip, "--strip-debug", "-o", temp, path], capture_output=True).returncode != 0:
+            logger.info("Could not strip {}".format(path))
+            return 0
+        stripped_size = os.path.getsize(temp)
+        if stripped_size >= size:
+            return 0
+        shutil.copymode(path, temp)
+        os.replace(temp, path)
+        return size - stripped_size
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def _directory_size(path):
+    return sum(os.lstat(os.path.join(root, f)).st_size for root, _, files in os.walk(path) for f in files)
+
+
+def _remove_empty_dirs(venv_dir, directories):
+    """Remove directories left empty, and any parents left empty in turn."""
+    for directory in sorted(directories, key=len, reverse=True):
+        while directory != venv_dir and os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
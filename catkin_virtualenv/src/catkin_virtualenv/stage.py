@@ -0,0 +1,104 @@
+# Software License Agreement (GPL)
+#
+# \file      stage.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import errno
+import fcntl
+import logging
+import os
+import shutil
+
+from collections import Counter
+
+from .layers import BASE_PTH
+
+# ioctl request to share a file's extents with another, on filesystems that support it (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+_NO_REFLINK_ERRNOS = (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF)
+
+logger = logging.getLogger(__name__)
+
+
+def stage(venv_dir, destination):
+    # type: (str, str) -> Dict[str, int]
+    """
+    Stage a copy of a virtualenv for relocation, without copying the bulk of its data.
+
+    Files are reflinked where the filesystem supports it, or hardlinked otherwise. Files that relocation rewrites are
+    really copied if they can't be reflinked, so relocating the staged copy never touches the original; relocation
+    replaces rather than modifies files anyway, as does pip. Symlinks are preserved, and bytecode is skipped since
+    relocation invalidates it. Returns the number of files staged by each method.
+    """
+    counts = Counter()
+    reflink = [True]
+
+    def stage_file(source, target):
+        if reflink[0]:
+            try:
+                _reflink(source, target)
+                counts["reflinked"] += 1
+                return
+            except OSError as exc:
+                if exc.errno not in _NO_REFLINK_ERRNOS:
+                    raise
+                logger.info("Reflinks not supported from {} to {}".format(venv_dir, destination))
+                reflink[0] = False
+
+        if not _rewritten_by_relocation(venv_dir, source):
+            try:
+                os.link(source, target)
+                counts["hardlinked"] += 1
+                return
+            except OSError as exc:
+                if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+
+        shutil.copy2(source, target)
+        counts["copied"] += 1
+
+    if os.path.lexists(destination):
+        shutil.rmtree(destination)
+    shutil.copytree(
+        venv_dir,
+        destination,
+        symlinks=True,
+        ignore=shutil.ignore_patterns("__pycache__", "*.pyc", "*.pyo"),
+        copy_function=stage_file,
+    )
+
+    logger.info(
+        "Staged {} to {}: {}".format(
+            venv_dir, destination, ", ".join("{} {}".format(count, method) for method, count in sorted(counts.items()))
+        )
+    )
+    return dict(counts)
+
+
+def _reflink(source, target):
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+    shutil.copystat(source, target)
+
+
+def _rewritten_by_relocation(venv_dir, path):
+    relative = os.path.relpath(path, venv_dir)
+    return relative.startswith("bin" + os.sep) or relative == "pyvenv.cfg" or os.path.basename(path) == BASE_PTH
@@ -0,0 +1,118 @@
+# Software License Agreement (GPL)
+#
+# \file      store.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import errno
+import hashlib
+import logging
+import os
+import stat
+
+from collections import defaultdict
+
+from .distributions import find_site_packages, installed_distributions
+
+STORE_DIR_ENV = "CATKIN_VIRTUALENV_STORE_DIR"
+
+logger = logging.getLogger(__name__)
+
+
+class FileStore:
+    def __init__(self, path):
+        """
+        Manage a content-addressed store of files shared between virtualenvs via hardlinks.
+
+        Every object in the store is a hardlink to identical files in one or more virtualenvs, so an object with a
+        single link is no longer referenced by any virtualenv and can be garbage collected. The store must be on the
+        same filesystem as the virtualenvs it deduplicates.
+
+        Only site-packages is deduplicated, where files are only ever replaced rather than modified in place (by pip,
+        relocation and bytecode compilation alike), so sharing inodes between virtualenvs is safe.
+        """
+        self.path = path
+        self._objects = os.path.join(path, "objects")
+        os.makedirs(self._objects, exist_ok=True)
+
+    def dedupe(self, venv_dir):
+        """Hardlink the files in a virtualenv's site-packages to the store, returning bytes saved per distribution."""
+        saved = defaultdict(int)
+        for site_packages in find_site_packages(venv_dir):
+            owners = self._file_owners(site_packages)
+            for root, _, files in os.walk(site_packages):
+                for f in files:
+                    path = os.path.join(root, f)
+                    try:
+                        size = self._link(path)
+                    except OSError as exc:
+                        if exc.errno == errno.EXDEV:
+                            raise RuntimeError(
+                                "Store {} is not on the same filesystem as {}".format(self.path, venv_dir)
+                            ) from exc
+                        raise
+                    if size:
+                        saved[owners.get(os.path.relpath(path, site_packages), "<unowned>")] += size
+        return dict(saved)
+
+    def gc(self):
+        """Delete store objects that are no longer linked from any virtualenv, returning the bytes freed."""
+        freed = 0
+        for root, _, files in os.walk(self._objects):
+            for f in files:
+                path = os.path.join(root, f)
+                st = os.lstat(path)
+                if st.st_nlink == 1:
+                    os.remove(path)
+                    freed += st.st_size
+        return freed
+
+    def _link(self, path):
+        st = os.lstat(path)
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            return 0
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(chunk)
+        # Hardlinks share permissions, so files that only differ in mode are stored separately
+        name = "{}-{:o}".format(digest.hexdigest(), stat.S_IMODE(st.st_mode))
+        store_object = os.path.join(self._objects, name[:2], name)
+        os.makedirs(os.path.dirname(store_object), exist_ok=True)
+
+        try:
+            os.link(path, store_object)
+            return 0
+        except FileExistsError:
+            pass
+
+        if os.path.samefile(path, store_object):
+            return 0
+        temp = path + ".catkin_virtualenv_store"
+        try:
+            os.link(store_object, temp)
+        except FileNotFoundError:
+            # Garbage collected in the meantime
+            return self._link(path)
+        os.replace(temp, path)
+        return st.st_size
+
+    def _file_owners(self, site_packages):
+        owners = {}
+        for name, distribution in installed_distributions([site_packages]).items():
+            for f in distribution.files():
+                owners[os.path.normpath(f)] = name
+        return owners
@@ -0,0 +1,250 @@
+# Software License Agreement (GPL)
+#
+# \file      trace.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import atexit
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+
+from contextlib import contextmanager
+
+TRACE_DIR_ENV = "CATKIN_VIRTUALENV_TRACE"
+TRACE_PACKAGE_ENV = "CATKIN_VIRTUALENV_TRACE_PACKAGE"
+
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, stage, package=None, output_dir=None):
+        """
+        Record the commands run during one stage of a package's build, as Chrome trace events.
+
+        Each command becomes a complete event with its wall time, and the CPU time, peak RSS and exit status of the
+        process (including any subprocesses it waited for). The stage itself is recorded as an enclosing event. If
+        output_dir is given, the trace is written there at exit as <package>-<stage>-<pid>.json, with timestamps in
+        microseconds since the epoch so traces from parallel builds can be merged into one timeline.
+        """
+        self.stage = stage
+        self.package = package
+        self.output_dir = output_dir
+        self.events = []
+        self._started = time.time()
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._lock = threading.Lock()
+
+    def run(self, cmd, *args, **kwargs):
+        """Run a command like subprocess.run (without a timeout), recording its resource usage."""
+        check = kwargs.pop("check", False)
+        input = kwargs.pop("input", None)
+        if input is not None:
+            kwargs["stdin"] = subprocess.PIPE
+
+        with self.popen(cmd, *args, **kwargs) as process:
+            stdout, stderr = _communicate(process, input)
+
+        result = subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+        if check:
+            result.check_returncode()
+        return result
+
+    @contextmanager
+    def popen(self, cmd, *args, **kwargs):
+        """
+        Start a command like subprocess.Popen, recording its resource usage once it exits.
+
+        The process must be left for the tracer to wait for, rather than through Popen.wait or communicate, which would
+        reap it without its resource usage.
+        """
+        started = time.time()
+        start = time.perf_counter()
+        with subprocess.Popen(cmd, *args, **kwargs) as process:
+            try:
+                yield process
+            except BaseException:
+                process.kill()
+                raise
+            rusage = _reap(process)
+        wall = time.perf_counter() - start
+
+        event_args = {"command": list(cmd), "returncode": process.returncode}
+        if rusage is not None:
+            event_args["cpu_user"] = rusage.ru_utime
+            event_args["cpu_system"] = rusage.ru_stime
+            event_args["max_rss_kb"] = rusage.ru_maxrss
+        self._add_event(_command_name(cmd), started, wall, event_args)
+
+    def totals(self):
+        # type: () -> Dict[str, float]
+        """Sum up the stage so far: its wall time, and CPU time and peak RSS over this process and its commands."""
+        with self._lock:
+            commands = [event["args"] for event in self.events]
+        max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            "wall": time.perf_counter() - self._start,
+            "commands": len(commands),
+            "cpu": time.process_time() - self._start_cpu + sum(
+                command.get("cpu_user", 0.0) + command.get("cpu_system", 0.0) for command in commands
+            ),
+            "max_rss_kb": max([command.get("max_rss_kb", 0) for command in commands] + [max_rss_kb]),
+        }
+
+    def write(self):
+        events = [
+            {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": self._label()}},
+        ]
+        with self._lock:
+            events += self.events
+        stage_args = self.totals()
+        stage_args.update(package=self.package, stage=self.stage)
+        events.append(_complete_event(self.stage, "stage", self._started, stage_args.pop("wall"), 0, stage_args))
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, "{}-{}.json".format(self._label("-"), os.getpid()))
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(temp, path)
+
+    def _add_event(self, name, started, wall, args):
+        args.update(package=self.package, stage=self.stage)
+        event = _complete_event(name, self.stage, started, wall, threading.get_ident(), args)
+        with self._lock:
+            self.events.append(event)
+
+    def _label(self, separator=" "):
+        return separator.join(part for part in (self.package, self.stage) if part)
+
+
+def start(stage, record=False):
+    # type: (str, bool) -> Optional[Tracer]
+    """
+    Start tracing the commands run by this process for a build stage.
+
+    Traces are written to the directory named by CATKIN_VIRTUALENV_TRACE, tagged with the package named by
+    CATKIN_VIRTUALENV_TRACE_PACKAGE. If tracing isn't enabled, commands are only recorded if record is given.
+    """
+    global _tracer
+    output_dir = os.environ.get(TRACE_DIR_ENV)
+    if not output_dir and not record:
+        return None
+    _tracer = Tracer(stage, os.environ.get(TRACE_PACKAGE_ENV), output_dir or None)
+    if _tracer.output_dir is not None:
+        atexit.register(_tracer.write)
+    return _tracer
+
+
+def get_tracer():
+    # type: () -> Optional[Tracer]
+    return _tracer
+
+
+def load_events(paths):
+    # type: (List[str]) -> List[Dict]
+    """Load and merge trace events from files, or every trace in a directory."""
+    events = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".json"))
+        else:
+            files = [path]
+        for trace_file in files:
+            with open(trace_file, "r") as f:
+                events += json.load(f)["traceEvents"]
+    return events
+
+
+def summarize(events):
+    # type: (List[Dict]) -> List[Tuple[str, str, float, float, int]]
+    """Sum up stage events by package and stage, as (package, stage, wall, cpu, max_rss_kb), slowest first."""
+    totals = {}
+    for event in events:
+        if event.get("cat") != "stage":
+            continue
+        args = event["args"]
+        key = (args.get("package") or "", args["stage"])
+        wall, cpu, max_rss_kb = totals.get(key, (0.0, 0.0, 0))
+        totals[key] = (wall + event["dur"] / 1e6, cpu + args["cpu"], max(max_rss_kb, args["max_rss_kb"]))
+    return sorted(
+        (key + value for key, value in totals.items()),
+        key=lambda item: item[2],
+        reverse=True,
+    )
+
+
+def _communicate(process, input):
+    """Like Popen.communicate, but leaving the process running, for _reap to wait for."""
+    output = {}
+
+    def read(name):
+        output[name] = getattr(process, name).read()
+
+    threads = [threading.Thread(target=read, args=(name,)) for name in ("stdout", "stderr") if getattr(process, name)]
+    for thread in threads:
+        thread.start()
+    if process.stdin:
+        try:
+            if input:
+                process.stdin.write(input)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # Like communicate, ignore a process exiting without reading all of its input
+    for thread in threads:
+        thread.join()
+    return output.get("stdout"), output.get("stderr")
+
+
+def _reap(process):
+    """Wait for a process with wait4 rather than Popen.wait, to get its resource usage alone."""
+    if process.returncode is not None:
+        return None
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return None
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+
+def _complete_event(name, category, started, wall, tid, args):
+    return {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": started * 1e6,
+        "dur": wall * 1e6,
+        "pid": os.getpid(),
+        "tid": tid,
+        "args": args,
+    }
+
+
+def _command_name(cmd):
+    """Name a command by its executable and subcommands, e.g. 'python -m pip install'."""
+    name = [os.path.basename(cmd[0])]
+    for arg in cmd[1:4]:
+        if arg.startswith("-") and arg != "-m":
+            break
+        name.append(os.path.basename(arg) if os.sep in arg else arg)
+    return " ".join(name)
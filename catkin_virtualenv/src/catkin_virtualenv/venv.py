@@ -20,11 +20,13 @@
 from __future__ import print_function
 
 import difflib
+import glob
 import logging
 import os
 import re
 import shutil
 import subprocess
+import tempfile
 
 try:
     from urllib.request import urlretrieve
@@ -34,11 +36,20 @@ except ImportError:
 
 from distutils.spawn import find_executable
 
-from . import run_command, relocate
-from .collect_requirements import collect_requirements
+from packaging.utils import parse_wheel_filename
+
+from . import run_command, interpreter, layers, lock_targets, relocate
+from .cache import get_cache_dir, hash_key
+from .collect_requirements import collect_requirements, get_base_requirements_path, get_variant_requirements_path
+from .distributions import dependency_closure, find_site_packages, installed_distributions
+from .lock_check import check_locked
+from .requirements import MergedRequirements, RequirementsFile, write_requirements
 
-_BYTECODE_REGEX = re.compile(r".*\.py[co]")
 _COMMENT_REGEX = re.compile(r"(^|\s+)#.*$", flags=re.MULTILINE)
+# Installed by initialize and needed by catkin_virtualenv itself, never removed when syncing requirements
+_BOOTSTRAP_DISTRIBUTIONS = ["pip", "pip-tools", "setuptools", "wheel"]
+# Where distributions keep the wheels ensurepip would install, e.g. Debian's python3-pip-whl
+_PIP_WHEEL_DIRS = ["/usr/share/python-wheels"]
 
 logger = logging.getLogger(__name__)
 
@@ -48,7 +59,9 @@ class Virtualenv:
         """Manage a virtualenv at the specified path."""
         self.path = path
 
-    def initialize(self, python, use_system_packages, extra_pip_args, clean=True):
+    def initialize(
+        self, python, use_system_packages, extra_pip_args, clean=True, template_cache=None, wheel_cache=None
+    ):
         """Initialize a new virtualenv using the specified python version and extra arguments."""
         if clean:
             try:
@@ -69,19 +82,39 @@ class Virtualenv:
             "pip-tools==7.4.1",
         ]
 
-        builtin_venv = self._check_module(system_python, "venv")
-        if builtin_venv:
+        if template_cache is not None and clean:
+            key = hash_key(
+                os.path.realpath(system_python),
+                interpreter.probe(system_python)["sys_version"],
+                use_system_packages,
+                preinstall,
+                extra_pip_args,
+            )
+
+            def build(path):
+                Virtualenv(path)._create(
+                    python, system_python, use_system_packages, extra_pip_args, preinstall, wheel_cache
+                )
+
+            template_cache.clone(key, build, self.path)
+            return
+
+        self._create(python, system_python, use_system_packages, extra_pip_args, preinstall, wheel_cache)
+
+    def _create(self, python, system_python, use_system_packages, extra_pip_args, preinstall, wheel_cache):
+        info = interpreter.probe(system_python)
+        if info["modules"]["venv"]:
             virtualenv = [system_python, "-m", "venv"]
         else:
             virtualenv = ["virtualenv", "--no-setuptools", "--verbose", "--python", python]
             # py2's virtualenv command will try install latest setuptools. setuptools>=45 not compatible with py2,
             # but we do require a reasonably up-to-date version (because of pip==20.1), so v44 at least.
-            preinstall += ["setuptools>=44,<45"]
+            preinstall = preinstall + ["setuptools>=44,<45"]
 
         if use_system_packages:
             virtualenv.append("--system-site-packages")
 
-        without_pip = self._check_module(system_python, "ensurepip") is False
+        without_pip = not info["modules"]["ensurepip"]
         if without_pip:
             virtualenv.append("--without-pip")
 
@@ -89,43 +122,119 @@ class Virtualenv:
         run_command(virtualenv, check=True)
 
         if without_pip:
-            # install pip via get-pip.py
-            version_proc = run_command(
-                ["python", "-cimport sys; print('{}.{}'.format(*sys.version_info))"], capture_output=True
-            )
-            version = version_proc.stdout
-            if isinstance(version, bytes):
-                version = version.decode("utf-8")
-            version = version.strip()
-            # download pip from https://bootstrap.pypa.io/pip/
-            get_pip_path, _ = urlretrieve("https://bootstrap.pypa.io/pip/get-pip.py")
-            run_command([self._venv_bin("python"), get_pip_path], check=True)
-
-        # (gservin): test --no-cache-dir
-        run_command(
-            [self._venv_bin("python"), "-m", "pip", "install", "--no-cache-dir", "-vvv"] + extra_pip_args + preinstall,
-            check=True,
+            self._bootstrap_pip(extra_pip_args, preinstall)
+
+        self._run_pip(
+            [self._venv_bin("python"), "-m", "pip", "install", "-vvv"] + extra_pip_args + preinstall, wheel_cache
         )
 
-    def install(self, requirements, extra_pip_args):
-        """Purge the cache first before installing."""  # (KLAD) testing to debug an issue on build farm
-        command = [self._venv_bin("python"), "-m", "pip", "cache", "purge"]
-        """ Sync a virtualenv with the specified requirements."""  # (KLAD) testing no-cache-dir
-        command = [self._venv_bin("python"), "-m", "pip", "install", "-vvv", "--no-cache-dir"] + extra_pip_args
-        for req in requirements:
-            run_command(command + ["-r", req], check=True)
+    def install(
+        self,
+        requirements,
+        extra_pip_args,
+        wheel_cache=None,
+        merge=False,
+        package_requirements=None,
+        strict=False,
+        base_venv=None,
+    ):
+        """Sync a virtualenv with the specified requirements."""
+        if base_venv is not None:
+            self._stack_on(base_venv, requirements)
+
+        command = [self._venv_bin("python"), "-m", "pip", "install", "-vvv"] + extra_pip_args
+        if not merge:
+            for req in requirements:
+                self._run_pip(command + ["-r", req], wheel_cache)
+            return
+
+        merged = MergedRequirements(
+            requirements, overrides=[package_requirements] if package_requirements else [], strict=strict
+        )
+        with tempfile.NamedTemporaryFile(
+            mode="w", prefix="requirements-", suffix=".txt", dir=os.path.dirname(os.path.abspath(self.path))
+        ) as merged_requirements:
+            merged.write(merged_requirements.name)
+            self._run_pip(command + ["-r", merged_requirements.name], wheel_cache)
+
+    def sync(
+        self, requirements, extra_pip_args, wheel_cache=None, package_requirements=None, strict=False, base_venv=None
+    ):
+        """Incrementally sync a virtualenv with locked requirements, only touching distributions that differ."""
+        if base_venv is not None:
+            self._stack_on(base_venv, requirements)
+
+        merged = MergedRequirements(
+            requirements, overrides=[package_requirements] if package_requirements else [], strict=strict
+        )
+        installed = installed_distributions(find_site_packages(self.path))
+        available = installed_distributions(layers.base_site_packages(self.path))
+        available.update(installed)
+        wanted = set()
+        extras = {}
+        to_install = []
+        changes = []
+        for line in merged.requirements:
+            name = line.name
+            if name is not None:
+                wanted.add(name)
+                extras.setdefault(name, set()).update(line.requirement.extras)
+            distribution = available.get(name)
+
+            if distribution is not None and line.requirement.marker is None and not line.requirement.url:
+                if line.requirement.specifier.contains(distribution.version, prereleases=True):
+                    continue
+                changes.append("upgrade {} {} -> {}".format(name, distribution.version, line.line))
+            elif distribution is None and name is not None and line.requirement.marker is None:
+                changes.append("install {}".format(line.line))
+            to_install.append(line)
+
+        # Keep anything the locked requirements still need, in case they aren't fully locked
+        keep = dependency_closure(
+            wanted.union(_BOOTSTRAP_DISTRIBUTIONS),
+            installed,
+            extras=extras,
+            environment=interpreter.probe(self._venv_bin("python"))["markers"],
+        )
+        to_remove = sorted(set(installed) - keep)
+        changes += ["uninstall {} {}".format(name, installed[name].version) for name in to_remove]
+
+        if to_remove:
+            run_command([self._venv_bin("python"), "-m", "pip", "uninstall", "-y"] + to_remove, check=True)
+
+        if to_install:
+            with tempfile.NamedTemporaryFile(
+                mode="w", prefix="requirements-", suffix=".txt", dir=os.path.dirname(os.path.abspath(self.path))
+            ) as delta_requirements, tempfile.NamedTemporaryFile(
+                mode="w", prefix="constraints-", suffix=".txt", dir=os.path.dirname(os.path.abspath(self.path))
+            ) as constraints:
+                write_requirements(delta_requirements.name, merged.options, to_install)
+                constraints.write("".join(str(line.requirement) + "\n" for line in merged.requirements if line.pin))
+                constraints.flush()
+                command = [self._venv_bin("python"), "-m", "pip", "install", "-vvv"] + extra_pip_args
+                self._run_pip(command + ["-r", delta_requirements.name, "-c", constraints.name], wheel_cache)
+
+        return changes
+
+    def check(self, requirements, extra_pip_args, resolution_cache=None, static=True):
+        """
+        Check if a set of requirements is completely locked.
+
+        Returns the changes that would lock the requirements, and whether that was decided by static analysis of the
+        installed virtualenv ("static"), a cached resolution ("cached") or by running pip-compile ("resolved").
+        """
+        if static:
+            problems = check_locked(requirements, self.path)
+            if problems is not None:
+                return problems, "static"
 
-    def check(self, requirements, extra_pip_args):
-        """Check if a set of requirements is completely locked."""
         with open(requirements, "r") as f:
             existing_requirements = f.read()
 
         # Re-lock the requirements
-        command = [self._find_pip_compile(), "--no-header", "--annotation-style", "line", requirements, "-o", "-"]
-        if extra_pip_args:
-            command += ["--pip-args", " ".join(extra_pip_args)]
-
-        generated_requirements = run_command(command, check=True, capture_output=True).stdout.decode()
+        hits = resolution_cache.hits if resolution_cache is not None else 0
+        generated_requirements = self._pip_compile(requirements, "-", extra_pip_args, resolution_cache)
+        source = "cached" if resolution_cache is not None and resolution_cache.hits > hits else "resolved"
 
         def _format(content):
             # Remove comments
@@ -141,44 +250,54 @@ class Virtualenv:
         # Compare against existing requirements
         diff = list(difflib.unified_diff(_format(existing_requirements), _format(generated_requirements)))
 
-        return diff
+        return diff, source
 
-    def lock(self, package_name, input_requirements, no_overwrite, extra_pip_args):
-        """Create a frozen requirement set from a set of input specifications."""
+    def lock(
+        self, package_name, input_requirements, no_overwrite, extra_pip_args, resolution_cache=None, targets=None,
+        jobs=None
+    ):
+        """
+        Create a frozen requirement set from a set of input specifications.
+
+        With targets, lock files are instead written for each of the given distros, as requirements-<codename>.txt
+        variants next to the exported requirements.
+        """
         try:
             output_requirements = collect_requirements(package_name, no_deps=True)[0]
         except IndexError:
             logger.info("Package doesn't export any requirements, step can be skipped")
             return
 
-        if no_overwrite and os.path.exists(output_requirements):
-            logger.info("Lock file already exists, not overwriting")
-            return
-
-        pip_compile = self._find_pip_compile()
-        command = [pip_compile, "--no-header", "--annotation-style", "line", input_requirements]
-
-        if os.path.normpath(input_requirements) == os.path.normpath(output_requirements):
-            raise RuntimeError(
-                "Trying to write locked requirements {} into a path specified as input: {}".format(
-                    output_requirements, input_requirements
+        if targets:
+            base_requirements = get_base_requirements_path(output_requirements)
+            outputs = {target: get_variant_requirements_path(base_requirements, target.codename) for target in targets}
+        else:
+            outputs = {None: output_requirements}
+
+        for target, output in list(outputs.items()):
+            if no_overwrite and os.path.exists(output):
+                logger.info("Lock file {} already exists, not overwriting".format(output))
+                del outputs[target]
+            elif os.path.normpath(input_requirements) == os.path.normpath(output):
+                raise RuntimeError(
+                    "Trying to write locked requirements {} into a path specified as input: {}".format(
+                        output, input_requirements
+                    )
                 )
-            )
-
-        if extra_pip_args:
-            command += ["--pip-args", " ".join(extra_pip_args)]
-
-        command += ["-o", output_requirements]
 
-        run_command(command, check=True)
-
-        logger.info("Wrote new lock file to {}".format(output_requirements))
+        if None in outputs:
+            self._pip_compile(input_requirements, output_requirements, extra_pip_args, resolution_cache)
+            logger.info("Wrote new lock file to {}".format(output_requirements))
+        elif outputs:
+            lock_targets.lock_targets(
+                self._venv_bin("python"), input_requirements, outputs.get, list(outputs), extra_pip_args, jobs
+            )
 
-    def relocate(self, target_dir):
-        """Relocate a virtualenv to another directory."""
-        self._delete_bytecode()
-        relocate.fix_shebangs(self.path, target_dir)
-        relocate.fix_activate_path(self.path, target_dir)
+    def relocate(self, target_dir, base_venv=None):
+        """Relocate a virtualenv to another directory, returning the files that changed."""
+        changed = relocate.relocate(self.path, target_dir)
+        if base_venv is not None:
+            layers.write_base(self.path, base_venv)
 
         # This workaround has been flaky - let's just delete the 'local' folder entirely
         # relocate.fix_local_symlinks(self.path)
@@ -186,6 +305,27 @@ class Virtualenv:
         if os.path.exists(local_dir):
             shutil.rmtree(local_dir)
 
+        return changed
+
+    def precompile(self, target_dir, invalidation_mode=None, optimize_levels=(0,)):
+        """
+        Compile bytecode for the virtualenv's site-packages, embedding source paths as they will be under target_dir.
+
+        Compilation runs in a process pool, once per optimization level. Hash-based invalidation modes make bytecode
+        independent of source timestamps, and unchecked-hash bytecode is never revalidated at import time.
+        """
+        python = self._venv_bin("python")
+        for site_packages in find_site_packages(self.path):
+            target_site_packages = os.path.join(target_dir, os.path.relpath(site_packages, self.path))
+            for level in optimize_levels:
+                # compileall only supports multiple optimization levels in one invocation from python 3.9
+                command = [python] + ["-O"] * level + ["-m", "compileall", "-q", "-j", "0"]
+                if invalidation_mode is not None:
+                    command += ["--invalidation-mode", invalidation_mode]
+                command += ["-d", target_site_packages, site_packages]
+                if run_command(command).returncode != 0:
+                    logger.warning("Some modules in {} could not be compiled".format(site_packages))
+
     def _venv_bin(self, binary_name):
         if os.path.exists(os.path.join(self.path, "bin", binary_name)):
             return os.path.abspath(os.path.join(self.path, "bin", binary_name))
@@ -202,18 +342,87 @@ class Virtualenv:
                 raise RuntimeError("pip-compile not found found in Venv or global PATH") from exc
             return global_pip_compile
 
-    def _check_module(self, python_executable, module):
-        try:
-            with open(os.devnull, "w") as devnull:
-                # "-c 'import venv'" does not work with the subprocess module, but '-cimport venv' does
-                run_command([python_executable, "-cimport {}".format(module)], stderr=devnull, check=True)
-            return True
-        except subprocess.CalledProcessError:
-            return False
-
-    def _delete_bytecode(self):
-        """Remove all .py[co] files since they embed absolute paths."""
-        for root, _, files in os.walk(self.path):
-            for f in files:
-                if _BYTECODE_REGEX.match(f):
-                    os.remove(os.path.join(root, f))
+    def _pip_compile(self, input_requirements, output_requirements, extra_pip_args, resolution_cache):
+        """Resolve input requirements to the output file ("-" for none), returning the locked requirements."""
+        if resolution_cache is not None:
+            key = resolution_cache.key(
+                self._venv_bin("python"),
+                input_requirements,
+                extra_pip_args,
+                None if output_requirements == "-" else output_requirements,
+            )
+            resolution = resolution_cache.get(key)
+            if resolution is not None:
+                logger.info("Using cached resolution of {}".format(input_requirements))
+                if output_requirements != "-":
+                    with open(output_requirements, "w") as f:
+                        f.write(resolution)
+                return resolution
+
+        command = [self._find_pip_compile(), "--no-header", "--annotation-style", "line", input_requirements]
+        if extra_pip_args:
+            command += ["--pip-args", " ".join(extra_pip_args)]
+        command += ["-o", output_requirements]
+
+        if output_requirements == "-":
+            resolution = run_command(command, check=True, capture_output=True).stdout.decode()
+        else:
+            run_command(command, check=True)
+            with open(output_requirements, "r") as f:
+                resolution = f.read()
+
+        if resolution_cache is not None:
+            resolution_cache.put(key, resolution)
+        return resolution
+
+    def _stack_on(self, base_venv, requirements):
+        lines = [line for path in requirements for line in RequirementsFile(path).requirements]
+        layers.check_base(self.path, base_venv, lines)
+        layers.write_base(self.path, base_venv)
+
+    def _run_pip(self, command, wheel_cache):
+        if wheel_cache is None:
+            run_command(command + ["--no-cache-dir"], check=True)
+        else:
+            wheel_cache.run_pip(command, self._venv_bin("python"))
+
+    def _bootstrap_pip(self, extra_pip_args, preinstall):
+        """
+        Install pip into a virtualenv created without it, for interpreters without ensurepip.
+
+        pip is installed offline from a wheel in the shared cache, or one bundled by the distribution, newest first.
+        Failing that, it's installed via get-pip.py, and a pip wheel is downloaded into the shared cache (if enabled)
+        so the next bootstrap doesn't need the network.
+        """
+        python = self._venv_bin("python")
+        cache_dir = get_cache_dir("bootstrap")
+        for wheel in _find_pip_wheels(([cache_dir] if cache_dir else []) + _PIP_WHEEL_DIRS):
+            try:
+                # pip can run from its own wheel to install itself
+                run_command([python, os.path.join(wheel, "pip"), "install", "--no-index", "-q", wheel], check=True)
+                return
+            except subprocess.CalledProcessError:
+                logger.warning("Failed to bootstrap pip from {}".format(wheel))
+
+        logger.warning("No usable pip wheel found, downloading get-pip.py")
+        # download pip from https://bootstrap.pypa.io/pip/
+        get_pip_path, _ = urlretrieve("https://bootstrap.pypa.io/pip/get-pip.py")
+        run_command([python, get_pip_path], check=True)
+
+        if cache_dir is not None:
+            download_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".download-")
+            try:
+                result = run_command(
+                    [python, "-m", "pip", "download", "--no-deps", "--only-binary=:all:", "-d", download_dir]
+                    + extra_pip_args + [requirement for requirement in preinstall if requirement.startswith("pip==")],
+                )
+                for wheel in _find_pip_wheels([download_dir]) if result.returncode == 0 else []:
+                    os.replace(wheel, os.path.join(cache_dir, os.path.basename(wheel)))
+            finally:
+                shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def _find_pip_wheels(directories):
+    """Find pip wheels in directories, newest first."""
+    wheels = [wheel for directory in directories for wheel in glob.glob(os.path.join(directory, "pip-*.whl"))]
+    return sorted(wheels, key=lambda wheel: parse_wheel_filename(os.path.basename(wheel))[1], reverse=True)
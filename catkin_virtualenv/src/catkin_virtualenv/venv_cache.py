@@ -0,0 +1,136 @@
+# Software License Agreement (GPL)
+#
+# \file      venv_cache.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import shutil
+
+from . import relocate
+from .cache import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class VenvCache:
+    DEFAULT_MAX_ENTRIES = 8
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Manage a directory of prebuilt virtualenvs, keyed by a content hash of whatever went into building them.
+
+        Each entry <key> is accompanied by <key>.lock, which builders hold exclusively and cloners hold shared, and
+        <key>.complete, which marks a finished build and whose mtime tracks the last use for LRU eviction.
+        """
+        self.path = path
+        self.max_entries = max_entries
+
+    def clone(self, key, build, destination):
+        """Copy the venv cached under key to destination, building it with build(path) on a cache miss."""
+        entry, lock, complete = self._entry_paths(key)
+
+        with file_lock(lock, shared=True):
+            hit = os.path.exists(complete)
+            if hit:
+                self._copy(entry, destination)
+                os.utime(complete)
+
+        if not hit:
+            with file_lock(lock):
+                # Someone else may have built this entry while we were waiting for the lock
+                if not os.path.exists(complete):
+                    logger.info("Building cached virtualenv {}".format(entry))
+                    shutil.rmtree(entry, ignore_errors=True)
+                    build(entry)
+                    open(complete, "w").close()
+                self._copy(entry, destination)
+
+        logger.info("Cloned cached virtualenv {} ({})".format(entry, "hit" if hit else "miss"))
+        self.evict()
+        return hit
+
+    def __contains__(self, key):
+        return os.path.exists(self._entry_paths(key)[2])
+
+    def build(self, key, build):
+        """Make sure a venv is cached under key, building it with build(path) if not. Returns whether it was cached."""
+        entry, lock, complete = self._entry_paths(key)
+
+        with file_lock(lock):
+            cached = os.path.exists(complete)
+            if cached:
+                os.utime(complete)
+            else:
+                logger.info("Building cached virtualenv {}".format(entry))
+                shutil.rmtree(entry, ignore_errors=True)
+                build(entry)
+                open(complete, "w").close()
+
+        self.evict()
+        return cached
+
+    def clone_cached(self, key, destination):
+        """Copy the venv cached under key to destination, only if it has already been built."""
+        entry, lock, complete = self._entry_paths(key)
+
+        with file_lock(lock, shared=True):
+            if not os.path.exists(complete):
+                return False
+            self._copy(entry, destination)
+            os.utime(complete)
+
+        logger.info("Cloned cached virtualenv {}".format(entry))
+        return True
+
+    def evict(self):
+        """Remove least-recently-used entries beyond max_entries, skipping any that are currently in use."""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".complete"):
+                try:
+                    mtime = os.path.getmtime(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue  # Evicted by someone else since listing
+                entries.append((mtime, name[: -len(".complete")]))
+
+        entries.sort(reverse=True)
+        for mtime, key in entries[self.max_entries:]:
+            entry, lock, complete = self._entry_paths(key)
+            with file_lock(lock, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                # Another evictor may have beaten us to it, or the entry may have been used or rebuilt since the scan
+                try:
+                    if os.path.getmtime(complete) > mtime:
+                        continue
+                    os.remove(complete)
+                except FileNotFoundError:
+                    continue
+                logger.info("Evicting cached virtualenv {}".format(entry))
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def _entry_paths(self, key):
+        entry = os.path.join(self.path, key)
+        return entry, entry + ".lock", entry + ".complete"
+
+    def _copy(self, entry, destination):
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        shutil.copytree(entry, destination, symlinks=True)
+
+        # Keep the template's bytecode, stale source paths in it only affect tracebacks
+        relocate.relocate(destination, os.path.abspath(destination), delete_bytecode=False)
@@ -0,0 +1,151 @@
+# Software License Agreement (GPL)
+#
+# \file      wheel_cache.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+from . import popen_command, interpreter
+from .cache import file_lock
+
+MAX_SIZE_ENV = "CATKIN_VIRTUALENV_WHEEL_CACHE_MB"
+
+# Files used this recently are never evicted, so a pip run doesn't lose a wheel between finding and installing it
+_EVICTION_GRACE_SECONDS = 10 * 60
+
+_HIT_REGEX = re.compile(r"^\s*Using cached \S+")
+_MISS_REGEX = re.compile(r"^\s*Downloading \S+")
+
+logger = logging.getLogger(__name__)
+
+
+class WheelCache:
+    DEFAULT_MAX_SIZE_MB = 10 * 1024
+
+    def __init__(self, path, max_size_mb=None):
+        """
+        Manage a pip cache shared between virtualenv builds.
+
+        The cache is partitioned per interpreter ABI, platform, libc and OS release, so that wheels built from sdists
+        are only ever reused by an interpreter that could have built them identically. Eviction runs alongside pip, one
+        evictor at a time, removing files one by one and sparing recently used ones. Hits and misses are counted from
+        pip's human-readable output, so they are best-effort statistics.
+        """
+        self.path = path
+        if max_size_mb is None:
+            max_size_mb = int(os.environ.get(MAX_SIZE_ENV, self.DEFAULT_MAX_SIZE_MB))
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._evict_lock = os.path.join(self.path, ".evict.lock")
+        self._stats = os.path.join(self.path, "stats.json")
+        self._stats_lock = self._stats + ".lock"
+
+    def run_pip(self, command, python):
+        """Run a pip command against the cache partition matching the python interpreter that will run it."""
+        partition = os.path.join(self.path, interpreter.get_tag(interpreter.probe(python)))
+
+        hits = 0
+        misses = 0
+        # Stream pip's output as it runs, counting cache hits and misses along the way
+        with popen_command(
+            command + ["--cache-dir", partition],
+            stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONUNBUFFERED="1"),
+        ) as process:
+            for line in process.stdout:
+                line = line.decode("utf-8", errors="replace")
+                sys.stdout.write(line)
+                sys.stdout.flush()
+                if _HIT_REGEX.match(line):
+                    hits += 1
+                elif _MISS_REGEX.match(line):
+                    misses += 1
+        self._record(hits, misses)
+
+        result = subprocess.CompletedProcess(process.args, process.returncode)
+        result.check_returncode()
+        self.evict()
+        return result
+
+    def summary(self):
+        """Describe cache effectiveness for this process and across all builds sharing the cache."""
+        with file_lock(self._stats_lock, shared=True):
+            total = self._read_stats()
+        return "Wheel cache {}: {} hits, {} misses ({} hits, {} misses overall)".format(
+            self.path, self.hits, self.misses, total["hits"], total["misses"]
+        )
+
+    def evict(self):
+        """Delete least-recently-used files until the cache fits in its size limit."""
+        with file_lock(self._evict_lock, blocking=False) as acquired:
+            if not acquired:
+                logger.info("Wheel cache is already being evicted")
+                return
+
+            entries = []
+            size = 0
+            for root, _, files in os.walk(self.path):
+                if root == self.path:
+                    # Bookkeeping files, the cache itself lives in per-interpreter partitions
+                    continue
+                for f in files:
+                    path = os.path.join(root, f)
+                    try:
+                        st = os.lstat(path)
+                    except FileNotFoundError:
+                        continue  # Replaced by pip since listing
+                    entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+                    size += st.st_size
+
+            if size <= self.max_size:
+                return
+
+            entries.sort()
+            recent = time.time() - _EVICTION_GRACE_SECONDS
+            for used, entry_size, path in entries:
+                if size <= self.max_size or used > recent:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+            logger.info("Evicted wheel cache down to {} bytes".format(size))
+
+    def _record(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+        with file_lock(self._stats_lock):
+            total = self._read_stats()
+            total["hits"] += hits
+            total["misses"] += misses
+            with open(self._stats + ".tmp", "w") as f:
+                json.dump(total, f)
+            os.replace(self._stats + ".tmp", self._stats)
+
+    def _read_stats(self):
+        try:
+            with open(self._stats, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {"hits": 0, "misses": 0}
@@ -0,0 +1,179 @@
+# Software License Agreement (GPL)
+#
+# \file      wheelhouse.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import logging
+import os
+import subprocess
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+
+from packaging.utils import canonicalize_name, canonicalize_version, parse_wheel_filename
+
+from . import run_command, interpreter
+from .cache import file_lock
+from .requirements import RequirementsFile
+
+logger = logging.getLogger(__name__)
+
+
+class Wheelhouse:
+    def __init__(self, path, jobs=None):
+        """
+        Manage a directory of wheels built from the sdists of locked requirements, for pip to find via --find-links.
+
+        Like the wheel cache, the wheelhouse is partitioned per interpreter ABI, platform, libc and OS release, so each
+        partition holds at most one wheel per pinned name and version. Pins found to have a compatible wheel on the
+        index are remembered too, so they aren't looked up again.
+        """
+        self.path = path
+        self.jobs = jobs
+
+    def partition(self, python):
+        # type: (str) -> str
+        partition = os.path.join(self.path, interpreter.get_tag(interpreter.probe(python)))
+        os.makedirs(os.path.join(partition, ".checked"), exist_ok=True)
+        return partition
+
+    def find_links_args(self, python):
+        # type: (str) -> List[str]
+        return ["--find-links", self.partition(python)]
+
+    def prebuild(self, python, requirements, extra_pip_args):
+        # type: (str, List[str], List[str]) -> List[str]
+        """
+        Build wheels for every pin of the requirements files that only has an sdist, returning the pins built.
+
+        python must be the interpreter of a virtualenv with pip, which wheels are built for. Wheels are built in
+        parallel, one process per pin, and pins that fail to build are left for pip to build at install time as usual.
+        """
+        partition = self.partition(python)
+        pending = self._pending(partition, requirements)
+        if not pending:
+            return []
+
+        sdists = {}
+        for pins in _rounds(pending):
+            try:
+                sdists.update(self._find_sdists(python, partition, pins, extra_pip_args))
+            except subprocess.CalledProcessError as exc:
+                logger.warning("Failed to resolve pins, not building wheels for them: {}".format(exc))
+        if not sdists:
+            return []
+
+        logger.info("Building wheels for {} sdist-only pins: {}".format(len(sdists), " ".join(sdists.values())))
+        built = []
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [
+                (pin, executor.submit(_build_wheel, python, partition, key, pin, extra_pip_args))
+                for key, pin in sorted(sdists.items())
+            ]
+            for pin, future in futures:
+                try:
+                    future.result()
+                    built.append(pin)
+                except subprocess.CalledProcessError as exc:
+                    logger.warning("Failed to build a wheel for {}, leaving it to pip: {}".format(pin, exc))
+        return built
+
+    def _pending(self, partition, requirements):
+        """Collect the pins of the requirements files that haven't been checked for or built into a wheel yet."""
+        built = _built(partition)
+        checked = set(os.listdir(os.path.join(partition, ".checked")))
+
+        pending = {}
+        for path in requirements:
+            for line in RequirementsFile(path).requirements:
+                if line.pin is None:
+                    continue
+                key = _key(line.name, line.pin)
+                if key not in built and _checked_name(*key) not in checked:
+                    pending.setdefault(key, str(line.requirement))
+        return pending
+
+    def _find_sdists(self, python, partition, pins, extra_pip_args):
+        """Resolve pins without installing them, returning those pip would build from an sdist by name and version."""
+        with tempfile.TemporaryDirectory() as work_dir:
+            pins_path = os.path.join(work_dir, "pins.txt")
+            report_path = os.path.join(work_dir, "report.json")
+            with open(pins_path, "w") as f:
+                f.writelines(pin + "\n" for pin in pins.values())
+            run_command(
+                [python, "-m", "pip", "install", "--dry-run", "--ignore-installed", "--no-deps", "--quiet",
+                 "--report", report_path, "--find-links", partition] + extra_pip_args + ["-r", pins_path],
+                check=True,
+            )
+            with open(report_path, "r") as f:
+                report = json.load(f)
+
+        sdists = {}
+        for item in report["install"]:
+            key = _key(item["metadata"]["name"], item["metadata"]["version"])
+            if key not in pins:
+                continue
+            if item["download_info"]["url"].endswith(".whl"):
+                open(os.path.join(partition, ".checked", _checked_name(*key)), "a").close()
+            else:
+                sdists[key] = pins[key]
+        return sdists
+
+
+def _key(name, version):
+    return canonicalize_name(name), canonicalize_version(version)
+
+
+def _built(partition):
+    built = set()
+    for f in os.listdir(partition):
+        if f.endswith(".whl"):
+            name, version, _, _ = parse_wheel_filename(f)
+            built.add(_key(name, str(version)))
+    return built
+
+
+def _checked_name(name, version):
+    return "{}-{}".format(name, version)
+
+
+def _rounds(pins):
+    """Split pins into rounds that pin each distribution at most once, since pip refuses double requirements."""
+    rounds = []
+    for (name, version), pin in sorted(pins.items()):
+        for pinned in rounds:
+            if not any(pinned_name == name for pinned_name, _ in pinned):
+                pinned[(name, version)] = pin
+                break
+        else:
+            rounds.append({(name, version): pin})
+    return rounds
+
+
+def _build_wheel(python, partition, key, pin, extra_pip_args):
+    """Build a wheel for a single pin into the partition, unless another build got there first."""
+    with file_lock(os.path.join(partition, ".lock-{}".format(_checked_name(*key)))):
+        if key in _built(partition):
+            return
+        with tempfile.TemporaryDirectory(dir=partition, prefix=".build-") as build_dir:
+            run_command(
+                [python, "-m", "pip", "wheel", "--no-deps", "--quiet", "-w", build_dir] + extra_pip_args + [pin],
+                check=True,
+            )
+            for f in os.listdir(build_dir):
+                if f.endswith(".whl"):
+                    os.replace(os.path.join(build_dir, f), os.path.join(partition, f))
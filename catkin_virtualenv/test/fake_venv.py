@@ -0,0 +1,43 @@
+# Software License Agreement (GPL)
+#
+# \file      fake_venv.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import sys
+
+
+def make_venv(path):
+    """Lay out an empty virtualenv for this interpreter, without creating one."""
+    site_packages = os.path.join(path, "lib", "python{}.{}".format(*sys.version_info[:2]), "site-packages")
+    os.makedirs(site_packages)
+    os.makedirs(os.path.join(path, "bin"))
+    os.symlink(sys.executable, os.path.join(path, "bin", "python"))
+    # Keep anything run with the virtualenv's python inside it
+    with open(os.path.join(path, "pyvenv.cfg"), "w") as f:
+        f.write("home = {}\ninclude-system-site-packages = false\n".format(os.path.dirname(sys.executable)))
+    return site_packages
+
+
+def add_distribution(site_packages, name, version, requires=(), extras=()):
+    """Install metadata for a distribution, as a wheel would."""
+    metadata_dir = os.path.join(site_packages, "{}-{}.dist-info".format(name.replace("-", "_"), version))
+    os.makedirs(metadata_dir)
+    with open(os.path.join(metadata_dir, "METADATA"), "w") as f:
+        f.write("Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(name, version))
+        f.writelines("Provides-Extra: {}\n".format(extra) for extra in extras)
+        f.writelines("Requires-Dist: {}\n".format(requirement) for requirement in requires)
+    return metadata_dir
@@ -0,0 +1,70 @@
+# Software License Agreement (GPL)
+#
+# \file      test_distributions.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+from catkin_virtualenv.distributions import dependency_closure, installed_distributions
+
+from fake_venv import add_distribution, make_venv
+
+
+class TestDependencyClosure(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.site_packages = make_venv(os.path.join(self.temp_dir.name, "venv"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def closure(self, names, **kwargs):
+        return dependency_closure(names, installed_distributions([self.site_packages]), **kwargs)
+
+    def test_requested_extras(self):
+        add_distribution(self.site_packages, "foo", "1.0", ['bar; extra == "bar"', 'baz[qux]; extra == "baz"'],
+                         extras=["bar", "baz"])
+        add_distribution(self.site_packages, "bar", "1.0")
+        add_distribution(self.site_packages, "baz", "1.0", ['qux; extra == "qux"'], extras=["qux"])
+        add_distribution(self.site_packages, "qux", "1.0")
+
+        self.assertEqual(self.closure(["foo"]), {"foo"})
+        self.assertEqual(self.closure(["foo"], extras={"foo": {"bar"}}), {"foo", "bar"})
+        # Extras requested by a dependency are followed through too
+        self.assertEqual(self.closure(["foo"], extras={"foo": {"baz"}}), {"foo", "baz", "qux"})
+
+    def test_environment_markers(self):
+        add_distribution(self.site_packages, "foo", "1.0", ['bar; python_version < "3"', 'baz; python_version >= "3"'])
+        add_distribution(self.site_packages, "bar", "1.0")
+        add_distribution(self.site_packages, "baz", "1.0")
+
+        self.assertEqual(self.closure(["foo"]), {"foo", "baz"})
+        self.assertEqual(self.closure(["foo"], environment={"python_version": "2.7"}), {"foo", "bar"})
+
+    def test_egg_info_sections(self):
+        metadata_dir = os.path.join(self.site_packages, "foo.egg-info")
+        os.makedirs(metadata_dir)
+        with open(os.path.join(metadata_dir, "PKG-INFO"), "w") as f:
+            f.write("Metadata-Version: 1.1\nName: foo\nVersion: 1.0\n")
+        with open(os.path.join(metadata_dir, "requires.txt"), "w") as f:
+            f.write('bar\n\n[baz]\nbaz\n\n[:python_version < "3"]\nqux\n')
+        for name in ("bar", "baz", "qux"):
+            add_distribution(self.site_packages, name, "1.0")
+
+        self.assertEqual(self.closure(["foo"]), {"foo", "bar"})
+        self.assertEqual(self.closure(["foo"], extras={"foo": {"baz"}}), {"foo", "bar", "baz"})
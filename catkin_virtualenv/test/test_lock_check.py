@@ -0,0 +1,73 @@
+# Software License Agreement (GPL)
+#
+# \file      test_lock_check.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+from catkin_virtualenv.lock_check import check_locked
+
+from fake_venv import add_distribution, make_venv
+
+
+class TestCheckLocked(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.venv_dir = os.path.join(self.temp_dir.name, "venv")
+        self.site_packages = make_venv(self.venv_dir)
+        add_distribution(self.site_packages, "foo", "1.0", ["bar>=2", 'baz; extra == "baz"'], extras=["baz"])
+        add_distribution(self.site_packages, "bar", "2.0")
+        add_distribution(self.site_packages, "baz", "1.0")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check(self, content):
+        requirements = os.path.join(self.temp_dir.name, "requirements.txt")
+        with open(requirements, "w") as f:
+            f.write(content)
+        return check_locked(requirements, self.venv_dir)
+
+    def test_locked(self):
+        self.assertEqual(self.check("bar==2.0\nfoo==1.0\n"), [])
+
+    def test_missing_dependency(self):
+        self.assertEqual(self.check("foo==1.0\n"), ["bar>=2 (required by foo==1.0) is missing"])
+
+    def test_missing_extra_dependency(self):
+        self.assertEqual(
+            self.check("bar==2.0\nfoo[baz]==1.0\n"), ['baz; extra == "baz" (required by foo[baz]==1.0[baz]) is missing']
+        )
+        self.assertEqual(self.check("bar==2.0\nbaz==1.0\nfoo[baz]==1.0\n"), [])
+
+    def test_unpinned(self):
+        self.assertEqual(self.check("bar>=2\nfoo==1.0\n"), ["bar>=2 is not pinned with =="])
+
+    def test_unsatisfied_pin(self):
+        add_distribution(self.site_packages, "qux", "1.0", ["bar>=3"])
+        self.assertEqual(
+            self.check("bar==2.0\nfoo==1.0\nqux==1.0\n"), ["bar==2.0 doesn't satisfy bar>=3 (required by qux==1.0)"]
+        )
+
+    def test_undecided(self):
+        """Anything the resolver might treat differently is left to it."""
+        self.assertIsNone(self.check("--index-url https://example.com\nbar==2.0\nfoo==1.0\n"))
+        self.assertIsNone(self.check('bar==2.0\nfoo==1.0; python_version >= "3"\n'))
+        self.assertIsNone(self.check("bar==2.0\nfoo==1.1\n"))
+        self.assertIsNone(self.check("bar==2.0\nfoo==1.0\nsetuptools==69.0.0\n"))
+        self.assertIsNone(self.check("bar==2.0\nbar==2.0\nfoo==1.0\n"))
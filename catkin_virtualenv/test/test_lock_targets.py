@@ -0,0 +1,57 @@
+# Software License Agreement (GPL)
+#
+# \file      test_lock_targets.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+from catkin_virtualenv.lock_check import check_locked
+from catkin_virtualenv.lock_targets import lock_lines
+
+from fake_venv import add_distribution, make_venv
+
+
+class TestLockTargets(unittest.TestCase):
+    def test_lock_lines_pass_static_check(self):
+        """Lock files written by venv_lock --targets must look like pip-compile's, or venv_check rejects them."""
+        # As pip's installation report spells them
+        installs = [
+            {"metadata": {"name": "setuptools", "version": "69.0.0"}},
+            {"metadata": {"name": "Zope.Interface", "version": "6.0"}},
+            {"metadata": {"name": "attrs", "version": "23.1.0"}},
+        ]
+        lines = lock_lines(installs)
+        self.assertEqual(lines, [
+            "attrs==23.1.0",
+            "zope-interface==6.0",
+            "",
+            "# The following packages are considered to be unsafe in a requirements file:",
+            "# setuptools",
+        ])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            venv_dir = os.path.join(temp_dir, "venv")
+            site_packages = make_venv(venv_dir)
+            add_distribution(site_packages, "attrs", "23.1.0")
+            add_distribution(site_packages, "zope.interface", "6.0", ["setuptools"])
+
+            requirements = os.path.join(temp_dir, "requirements.txt")
+            with open(requirements, "w") as f:
+                f.write("# Locked for jammy from requirements.in\n")
+                f.writelines(line + "\n" for line in lines)
+            self.assertEqual(check_locked(requirements, venv_dir), [])
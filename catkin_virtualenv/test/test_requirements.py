@@ -0,0 +1,70 @@
+# Software License Agreement (GPL)
+#
+# \file      test_requirements.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+from catkin_virtualenv.requirements import MergedRequirements
+
+
+class TestMergedRequirements(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def merge(self, *contents):
+        paths = []
+        for i, content in enumerate(contents):
+            paths.append(os.path.join(self.temp_dir.name, "requirements-{}.txt".format(i)))
+            with open(paths[-1], "w") as f:
+                f.write(content)
+        return MergedRequirements(paths)
+
+    def test_later_pin_wins(self):
+        merged = self.merge("foo==1.0\n", "foo==2.0\n")
+        self.assertEqual([line.line for line in merged.requirements], ["foo==2.0"])
+        self.assertEqual(len(merged.conflicts), 1)
+
+    def test_earlier_pin_kept_if_satisfied(self):
+        """Installing foo>=0.5 after foo==1.0 would leave 1.0 installed."""
+        merged = self.merge("foo==1.0\n", "foo>=0.5\n")
+        self.assertEqual([line.line for line in merged.requirements], ["foo==1.0"])
+        self.assertEqual(merged.conflicts, [])
+
+    def test_earlier_pin_replaced_if_unsatisfied(self):
+        merged = self.merge("foo==1.0\n", "foo>=1.5\n")
+        self.assertEqual([line.line for line in merged.requirements], ["foo>=1.5"])
+        self.assertEqual(len(merged.conflicts), 1)
+
+    def test_earlier_pin_replaced_for_new_extras(self):
+        merged = self.merge("foo==1.0\n", "foo[bar]>=0.5\n")
+        self.assertEqual([line.line for line in merged.requirements], ["foo[bar]>=0.5"])
+
+    def test_hashes_combined(self):
+        merged = self.merge(
+            "foo==1.0 --hash=sha256:aaaa\nbar==2.0 \\\n    --hash sha256:cccc\n",
+            "foo==1.0 --hash=sha256:aaaa --hash=sha256:bbbb\nbar==2.0 --hash=sha256:cccc\n",
+        )
+        self.assertEqual(
+            [line.options for line in merged.requirements],
+            [["--hash=sha256:aaaa", "--hash=sha256:bbbb"], ["--hash=sha256:cccc"]],
+        )
+        self.assertEqual(merged.conflicts, [])
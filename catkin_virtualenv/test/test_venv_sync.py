@@ -0,0 +1,42 @@
+# Software License Agreement (GPL)
+#
+# \file      test_venv_sync.py
+# \authors   Paul Bovbel <pbovbel@locusrobotics.com>
+# \copyright Copyright (c) (2017,), Locus Robotics, All rights reserved.
+#
+# This program is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+from catkin_virtualenv.venv import Virtualenv
+
+from fake_venv import add_distribution, make_venv
+
+
+class TestVirtualenvSync(unittest.TestCase):
+    def test_keeps_dependencies_of_requested_extras(self):
+        """Dependencies pulled in by an extra are needed even if the lock file doesn't list them."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            venv_dir = os.path.join(temp_dir, "venv")
+            site_packages = make_venv(venv_dir)
+            add_distribution(site_packages, "foo", "1.0", ['bar[qux]; extra == "bar"'], extras=["bar"])
+            add_distribution(site_packages, "bar", "2.0", ['qux; extra == "qux"'], extras=["qux"])
+            add_distribution(site_packages, "qux", "3.0")
+
+            requirements = os.path.join(temp_dir, "requirements.txt")
+            with open(requirements, "w") as f:
+                f.write("foo[bar]==1.0\n")
+
+            self.assertEqual(Virtualenv(venv_dir).sync([requirements], []), [])